@@ -132,6 +132,26 @@ class AppSettings:
         config.setdefault('allow_plugin_hiding', False)
 
         config.setdefault('cache_strides', True)
+        config.setdefault('stride_trees_maxsize', 100)
+        config.setdefault('stride_trees_shared_cache', False)
+        config.setdefault('stride_render_threads', 0)
+        config.setdefault('stride_fragment_store', 'cmsplugin_cascade.fragments.SharedFragmentStore')
+        config.setdefault('stride_fragments_local_maxsize', 1000)
+        config.setdefault('stride_fragments_local_maxbytes', 10 * 1024 * 1024)
+        config.setdefault('stride_fragments_local_timeout', 10)
+        config.setdefault('stride_fragments_timeout', None)
+        config.setdefault('stride_fragments_stale_timeout', 0)
+        config.setdefault('stride_fragments_lock_timeout', 0)
+        config.setdefault('stride_fragments_early_expiry_beta', 0)
+        config.setdefault('stride_bundle_root', None)
+        config.setdefault('stride_bundle_templates', {None: 'cascade/strides/bundle-page.html'})
+
+        try:
+            import orjson  # noqa: F401
+        except ImportError:
+            config.setdefault('glossary_decoder', 'json.loads')
+        else:
+            config.setdefault('glossary_decoder', 'orjson.loads')
 
         config.setdefault('register_page_editor', True)
 
@@ -0,0 +1,222 @@
+"""
+Compact binary format for stride files, which is memory mapped when loaded. Therefore all
+worker processes on a host share the same copy of a stride tree through the page cache,
+rather than each keeping its own parsed copy.
+
+The file consists of a header, followed by the offsets into the string table, the array of
+nodes, the array of fragment digests and the string table itself. All strings, ie. the plugin
+types and the JSON encoded data of each plugin without its primary key, are interned, so that
+identical glossaries are stored only once. The children of each node are stored contiguously,
+with the top-level nodes starting at index 0, and are only built when accessed for the first
+time. Only nodes of plugins caching their fragments refer to a precomputed fragment digest, the
+digests of all other nodes are computed on demand.
+"""
+import io
+import json
+import mmap
+import os
+import struct
+
+from cmsplugin_cascade.strides import (
+    EmulateQuerySet, StrideNode, StrideTreeCache, strides_element_map, strides_plugin_map)
+from cmsplugin_cascade.utils import get_subtree_digest
+
+__all__ = ['compile_stride', 'is_binary_stride', 'load_binary_stride']
+
+MAGIC = b'CSTR'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIIII')  # magic, version, reserved, num_strings, num_nodes, num_roots, num_digests
+OFFSET = struct.Struct('<I')
+NODE = struct.Struct('<HHIqIII')  # type, reserved, data, pk, first_child, num_children, fragment digest
+DIGEST = struct.Struct('<20s')
+NO_PK = -1
+NO_DIGEST = 0xFFFFFFFF
+
+
+def is_binary_stride(path):
+    with io.open(path, 'rb') as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+
+def compile_stride(source, target):
+    """
+    Compile the stride file ``source`` in JSON format into the binary file ``target``. Plugins
+    without a stride counterpart are skipped, as they would be when rendering the JSON file.
+    """
+    tree_data = StrideTreeCache._parse(source)
+    nodes = StrideNode.build(tree_data['plugins'])
+    plugin_types = {plugin_class: plugin_type for plugin_type, plugin_class in strides_plugin_map.items()}
+    strings, interned = [], {}
+
+    def intern(string):
+        if string not in interned:
+            interned[string] = len(strings)
+            strings.append(string.encode('utf-8'))
+        return interned[string]
+
+    # breadth first, so that the children of each node are stored contiguously
+    records, digests, queue = [], [], list(nodes)
+    next_index = len(queue)
+    for node in queue:
+        plugin_type = plugin_types[node.plugin.__class__]
+        # the primary key is stored in the node, so that equal data is interned
+        data = json.dumps({k: v for k, v in node.data.items() if k != 'pk'}, sort_keys=True, separators=(',', ':'))
+        pk = NO_PK if node.pk is None else node.pk
+        if getattr(node.plugin, 'cache', True):
+            digest_index = len(digests)
+            digests.append(DIGEST.pack(bytes.fromhex(node.fragment_digest)))
+        else:
+            digest_index = NO_DIGEST
+        records.append(NODE.pack(intern(plugin_type), 0, intern(data), pk, next_index, len(node.children),
+                                 digest_index))
+        queue.extend(node.children)
+        next_index += len(node.children)
+
+    offsets, position = [], 0
+    for string in strings:
+        offsets.append(position)
+        position += len(string)
+    offsets.append(position)
+
+    # write atomically, since processes may have mapped the previous version of this file
+    temp_target = '{}.{}.tmp'.format(target, os.getpid())
+    with io.open(temp_target, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, VERSION, 0, len(strings), len(records), len(nodes), len(digests)))
+        fp.writelines(OFFSET.pack(offset) for offset in offsets)
+        fp.writelines(records)
+        fp.writelines(digests)
+        fp.writelines(strings)
+    os.replace(temp_target, target)
+
+
+class MappedStrideTree:
+    """
+    Access the strings and nodes of a memory mapped binary stride file.
+    """
+    def __init__(self, path):
+        with io.open(path, 'rb') as fp:
+            self.buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from('<4sH', self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Unsupported format of binary stride file: {}".format(path))
+        _, _, _, num_strings, self.num_nodes, self.num_roots, num_digests = HEADER.unpack_from(self.buffer)
+        self.offsets_start = HEADER.size
+        self.nodes_start = self.offsets_start + OFFSET.size * (num_strings + 1)
+        self.digests_start = self.nodes_start + NODE.size * self.num_nodes
+        self.strings_start = self.digests_start + DIGEST.size * num_digests
+        self.plugin_instances = {}
+
+    def get_string(self, index):
+        start, end = struct.unpack_from('<II', self.buffer, self.offsets_start + OFFSET.size * index)
+        return self.buffer[self.strings_start + start:self.strings_start + end].decode('utf-8')
+
+    def get_node(self, index):
+        return NODE.unpack_from(self.buffer, self.nodes_start + NODE.size * index)
+
+    def get_digest(self, index):
+        return DIGEST.unpack_from(self.buffer, self.digests_start + DIGEST.size * index)[0].hex()
+
+
+class MappedStrideNode(StrideNode):
+    """
+    A ``StrideNode`` whose data and children are decoded from the memory mapped file on first
+    access and kept afterwards. Hence only the nodes actually used by a process are decoded, and
+    only once.
+    """
+    __slots__ = ('_tree', '_index', '_data', '_children', '_inline_elements', '_body_segments')
+
+    def __init__(self, tree, index, plugin, element_class, pk, parent=None):
+        self._tree = tree
+        self._index = index
+        self._data = self._children = self._inline_elements = self._body_segments = None
+        self.plugin = plugin
+        self.element_class = element_class
+        self.pk = pk
+        self.parent = parent
+        self.previous_sibling = self.next_sibling = None
+
+    @classmethod
+    def build(cls, tree, start=0, count=None, parent=None):
+        if count is None:
+            count = tree.num_roots
+        nodes = []
+        for index in range(start, start + count):
+            type_index, _, _, pk, _, _, _ = tree.get_node(index)
+            if type_index not in tree.plugin_instances:
+                plugin_type = tree.get_string(type_index)
+                tree.plugin_instances[type_index] = strides_plugin_map[plugin_type](), strides_element_map[plugin_type]
+            plugin, element_class = tree.plugin_instances[type_index]
+            nodes.append(cls(tree, index, plugin, element_class, None if pk == NO_PK else pk, parent))
+        cls.link_siblings(nodes)
+        return tuple(nodes)
+
+    @property
+    def children(self):
+        if self._children is None:
+            _, _, _, _, first_child, num_children, _ = self._tree.get_node(self._index)
+            self._children = self.build(self._tree, first_child, num_children, self)
+        return self._children
+
+    @property
+    def data(self):
+        if self._data is None:
+            data = json.loads(self._tree.get_string(self._tree.get_node(self._index)[2]))
+            if self.pk is not None:
+                data['pk'] = self.pk
+            self._data = data
+        return self._data
+
+    @property
+    def glossary(self):
+        return self.data.get('glossary', {})
+
+    @property
+    def inline_elements(self):
+        if self._inline_elements is None:
+            self._inline_elements = EmulateQuerySet(self.data.get('inlines', ()))
+        return self._inline_elements
+
+    @property
+    def body_segments(self):
+        if self._body_segments is None:
+            self._body_segments = self.element_class.tokenize_body(self)
+        return self._body_segments
+
+    @property
+    def digest(self):
+        plugin_type = self._tree.get_string(self._tree.get_node(self._index)[0])
+        render_template = getattr(self.plugin, 'render_template', None)
+        return get_subtree_digest(plugin_type, self.data, render_template, (c.digest for c in self.children))
+
+    @property
+    def fragment_digest(self):
+        digest_index = self._tree.get_node(self._index)[6]
+        if digest_index != NO_DIGEST:
+            return self._tree.get_digest(digest_index)
+        # the plugin did not cache its fragments when this file was compiled
+        ancestors, node = [], self.parent
+        while node is not None:
+            ancestors.insert(0, node)
+            node = node.parent
+        ancestors_digest = ''
+        for node in ancestors:
+            plugin_type = self._tree.get_string(self._tree.get_node(node._index)[0])
+            own_digest = get_subtree_digest(plugin_type, node.data, getattr(node.plugin, 'render_template', None))
+            ancestors_digest = self._hash(ancestors_digest, own_digest)
+        return self._hash(ancestors_digest, self.digest, str(self.pk))
+
+    def get_fragment_digests(self):
+        # read the records of the subtree, rather than building its nodes
+        indices = [self._index]
+        while indices:
+            _, _, _, _, first_child, num_children, digest_index = self._tree.get_node(indices.pop())
+            if digest_index != NO_DIGEST:
+                yield self._tree.get_digest(digest_index)
+            indices.extend(range(first_child + num_children - 1, first_child - 1, -1))
+
+
+def load_binary_stride(path):
+    """
+    Load the binary stride file and return its tree of ``MappedStrideNode``-s.
+    """
+    return MappedStrideNode.build(MappedStrideTree(path))
@@ -8,6 +8,7 @@ from django.utils.translation import ngettext_lazy, gettext_lazy as _
 from entangled.forms import EntangledModelFormMixin
 from cms.plugin_pool import plugin_pool
 from cmsplugin_cascade.bootstrap4.fields import BootstrapMultiSizeField
+from cmsplugin_cascade.bootstrap4.container import get_grid_column
 from cmsplugin_cascade.bootstrap4.grid import Breakpoint
 from cmsplugin_cascade.bootstrap4.picture import get_picture_elements
 from cmsplugin_cascade.bootstrap4.plugin_base import BootstrapPluginBase
@@ -148,13 +149,10 @@ class BootstrapCarouselSlidePlugin(BootstrapPluginBase):
         if obj.glossary.get('resize_options') != resize_options:
             obj.glossary.update(resize_options=resize_options)
             sanitized = True
-        parent = obj.parent
-        while parent.plugin_type != 'BootstrapColumnPlugin':
-            parent = parent.parent
-            if parent is None:
-                logger.warning("PicturePlugin(pk={}) has no ColumnPlugin as ancestor.".format(obj.pk))
-                return
-        grid_column = parent.get_bound_plugin().get_grid_instance()
+        grid_column = get_grid_column(obj)
+        if grid_column is None:
+            logger.warning("PicturePlugin(pk={}) has no ColumnPlugin as ancestor.".format(obj.pk))
+            return
         obj.glossary.setdefault('media_queries', {})
         for bp in Breakpoint:
             obj.glossary['media_queries'].setdefault(bp.name, {})
@@ -1,5 +1,4 @@
 from django.core.exceptions import ValidationError
-from django.db.models import Q
 from django.forms import widgets
 from django.forms.fields import BooleanField, ChoiceField, MultipleChoiceField
 from django.utils.safestring import mark_safe
@@ -65,12 +64,149 @@ class ContainerGridMixin:
             breakpoints = [getattr(grid.Breakpoint, bp) for bp in self.glossary['breakpoints']]
         except KeyError:
             breakpoints = [bp for bp in grid.Breakpoint]
-        if fluid:
-            bounds = dict((bp, grid.fluid_bounds[bp]) for bp in breakpoints)
-        else:
-            bounds = dict((bp, grid.default_bounds[bp]) for bp in breakpoints)
+        bounds = app_settings.CMSPLUGIN_CASCADE['bootstrap4']['fluid_bounds' if fluid else 'default_bounds']
+        bounds = dict((bp, bounds[bp]) for bp in breakpoints)
         return grid.Bootstrap4Container(bounds=bounds)
 
+    def solve_grid(self):
+        """
+        Compute the bounds of all rows and columns inside this container in one pass, using a single
+        query. Return a dict mapping the primary key of this container, of each of those rows and
+        columns and of each nested container onto its grid instance.
+        """
+        from cmsplugin_cascade.models import CascadeAncestry, CascadeElement
+
+        container_types = CascadeAncestry.container_types
+        grid_types = container_types + CascadeAncestry.row_types + CascadeAncestry.column_types
+        elements = CascadeElement.objects.filter(
+            placeholder_id=self.placeholder_id,
+            language=self.language,
+            path__startswith=self.path,
+            depth__gt=self.depth,
+            plugin_type__in=grid_types,
+        ).order_by('path').only('id', 'path', 'depth', 'plugin_type', 'glossary')
+
+        # each row belongs to its nearest container or column, each column to its nearest row
+        nodes = {self.path: (self, [])}
+        containers = [nodes[self.path]]
+        for element in elements:
+            node = nodes[element.path] = element, []
+            for length in range(len(element.path) - element.steplen, 0, -element.steplen):
+                parent, children = nodes.get(element.path[:length], (None, None))
+                if parent is None:
+                    continue
+                if element.plugin_type in container_types:
+                    containers.append(node)
+                elif (element.plugin_type in CascadeAncestry.row_types) == (parent.plugin_type not in CascadeAncestry.row_types):
+                    children.append(node)
+                else:
+                    continue
+                break
+
+        def get_rows(rows):
+            return [(row.pk, [(column.pk, ColumnGridMixin.get_column_classes(column), get_rows(nested_rows))
+                              for column, nested_rows in columns]) for row, columns in rows]
+
+        instances = {}
+        for container, rows in containers:
+            bounds = ContainerGridMixin.get_grid_instance(container).bounds
+            instances[container.pk], solved = grid.solve_grid(bounds, get_rows(rows))
+            instances.update(solved)
+        return instances
+
+    def get_grid_bounds(self, instances=None):
+        """
+        Return a dict mapping the primary key of each column and container inside this container
+        onto its bounds for each breakpoint, suitable for comparison.
+        """
+        if instances is None:
+            instances = self.solve_grid()
+        grid_bounds = {}
+        for pk, instance in instances.items():
+            if isinstance(instance, grid.Bootstrap4Column):
+                bounds = [brk.bound for brk in instance.breaks.values()]
+            elif isinstance(instance, grid.Bootstrap4Container):
+                bounds = [instance.bounds.get(bp) for bp in grid.Breakpoint]
+            else:
+                continue
+            grid_bounds[pk] = tuple(bound and (round(bound.min, 1), round(bound.max, 1)) for bound in bounds)
+        return grid_bounds
+
+    def sanitize_grid(self, previous_bounds, deferred=False):
+        """
+        Sanitize the descendants of this container after its grid changed, but descend only into
+        columns whose bounds differ from ``previous_bounds``, as returned by ``get_grid_bounds()``
+        before the change. Elements inside those columns find their grid column using
+        ``get_grid_column()`` without querying the database. If ``deferred`` is set, this container
+        is just recorded to be sanitized by the management command ``sanitize_pending``.
+        """
+        if deferred:
+            from cmsplugin_cascade.models import PendingSanitize
+
+            PendingSanitize.enqueue(self, previous_bounds)
+            return
+
+        instances = self.solve_grid()
+        grid_bounds = self.get_grid_bounds(instances)
+
+        def skip_column(column):
+            return grid_bounds[column.pk] == previous_bounds.get(column.pk)
+
+        self.sanitize_children(get_grid_filter(instances, skip_column))
+
+
+def get_grid_filter(instances=None, skip_column=None):
+    """
+    Return a function to be passed as ``filter_child`` to ``sanitize_children()``, which attaches
+    the grid instance of each column, as solved by ``ContainerGridMixin.solve_grid()``, to that column
+    and all elements inside, so that ``get_grid_column()`` does not query the database. Containers
+    missing in ``instances`` are solved on the fly. Columns for which ``skip_column`` returns True,
+    are not sanitized, and neither are the elements inside.
+    """
+    from cmsplugin_cascade.models import CascadeAncestry
+
+    instances = {} if instances is None else instances
+
+    def filter_child(child):
+        if child.plugin_type in CascadeAncestry.container_types and child.pk not in instances:
+            instances.update(child.solve_grid())
+        instance = instances.get(child.pk)
+        if isinstance(instance, grid.Bootstrap4Column):
+            if skip_column and skip_column(child):
+                return False
+            child._grid_column = instance
+        else:
+            parent = child.get_parent_instance()
+            if parent is not None and '_grid_column' in parent.__dict__:
+                child._grid_column = parent._grid_column
+        return True
+
+    return filter_child
+
+
+def get_grid_column(obj):
+    """
+    Return the ``Bootstrap4Column`` of the nearest column wrapping the given element, or None.
+    """
+    if '_grid_column' in obj.__dict__:
+        # set by the filter returned from get_grid_filter()
+        return obj._grid_column
+    column = obj.get_ancestry().get_nearest_element('BootstrapColumnPlugin')
+    if column:
+        return column.get_grid_instance()
+
+
+def get_grid_root(obj):
+    """
+    Return the nearest container or jumbotron wrapping the given element, or the element itself,
+    if it is one of them.
+    """
+    from cmsplugin_cascade.models import CascadeAncestry
+
+    if obj.plugin_type in CascadeAncestry.container_types:
+        return obj
+    return obj.get_ancestry().get_nearest_element(*CascadeAncestry.container_types)
+
 
 class BootstrapContainerPlugin(BootstrapPluginBase):
     name = _("Container")
@@ -103,8 +239,9 @@ class BootstrapContainerPlugin(BootstrapPluginBase):
         return css_classes
 
     def save_model(self, request, obj, form, change):
+        previous_bounds = type(obj).objects.get(pk=obj.pk).get_grid_bounds() if change else {}
         super().save_model(request, obj, form, change)
-        obj.sanitize_children()
+        obj.sanitize_grid(previous_bounds, app_settings.CMSPLUGIN_CASCADE['bootstrap4']['defer_sanitize'])
 
 plugin_pool.register_plugin(BootstrapContainerPlugin)
 
@@ -127,12 +264,10 @@ class BootstrapRowFormMixin(ManageChildrenFormMixin, EntangledModelFormMixin):
 
 class RowGridMixin:
     def get_grid_instance(self):
-        row = grid.Bootstrap4Row()
-        query = Q(plugin_type='BootstrapContainerPlugin') | Q(plugin_type='BootstrapColumnPlugin') \
-          | Q(plugin_type='BootstrapJumbotronPlugin')
-        container = self.get_ancestors().order_by('depth').filter(query).last().get_bound_plugin().get_grid_instance()
-        container.add_row(row)
-        return row
+        from cmsplugin_cascade.models import CascadeAncestry
+
+        container = self.get_ancestry().get_nearest_element(*CascadeAncestry.container_types)
+        return container.solve_grid().get(self.pk)
 
 
 class BootstrapRowPlugin(BootstrapPluginBase):
@@ -160,21 +295,15 @@ plugin_pool.register_plugin(BootstrapRowPlugin)
 class ColumnGridMixin:
     valid_keys = ['xs-column-width', 'sm-column-width', 'md-column-width', 'lg-column-width', 'xs-column-width',
                   'xs-column-offset', 'sm-column-offset', 'md-column-offset', 'lg-column-offset', 'xs-column-offset']
+
+    def get_column_classes(self):
+        return [val for key, val in self.glossary.items() if key in ColumnGridMixin.valid_keys and val]
+
     def get_grid_instance(self):
-        column = None
-        query = Q(plugin_type='BootstrapRowPlugin')
-        row_obj = self.get_ancestors().order_by('depth').filter(query).last().get_bound_plugin()
-        # column_siblings = row_obj.get_descendants().order_by('depth').filter(plugin_type='BootstrapColumnPlugin')
-        row = row_obj.get_grid_instance()
-        for column_sibling in self.get_siblings():
-            classes = [val for key, val in column_sibling.get_bound_plugin().glossary.items()
-                       if key in self.valid_keys and val]
-            if column_sibling.pk == self.pk:
-                column = grid.Bootstrap4Column(classes)
-                row.add_column(column)
-            else:
-                row.add_column(grid.Bootstrap4Column(classes))
-        return column
+        from cmsplugin_cascade.models import CascadeAncestry
+
+        container = self.get_ancestry().get_nearest_element(*CascadeAncestry.container_types)
+        return container.solve_grid().get(self.pk)
 
 
 class BootstrapColumnPlugin(BootstrapPluginBase):
@@ -200,12 +329,9 @@ class BootstrapColumnPlugin(BootstrapPluginBase):
         if 'parent' in self._cms_initial_attributes:
             container=self._cms_initial_attributes['parent'].get_ancestors().order_by('depth').last().get_bound_plugin()
         else:
-            containers=obj.get_ancestors().filter(plugin_type='BootstrapContainerPlugin')
-            if containers:
-                container=containers.order_by('depth').last().get_bound_plugin()
-            else:
-                jumbotrons=obj.get_ancestors().filter(plugin_type='BootstrapJumbotronPlugin')
-                container=jumbotrons.order_by('depth').last().get_bound_plugin()
+            ancestry = obj.get_ancestry()
+            container = ancestry.get_nearest_element('BootstrapContainerPlugin') \
+                or ancestry.get_nearest_element('BootstrapJumbotronPlugin')
         breakpoints = container.glossary['breakpoints']
 
         width_fields, offset_fields, reorder_fields, responsive_fields = {}, {}, {}, {}
@@ -334,8 +460,13 @@ class BootstrapColumnPlugin(BootstrapPluginBase):
         return super().get_form(request, obj, **kwargs)
 
     def save_model(self, request, obj, form, change):
+        # changing the width of a column may change the bounds of its siblings
+        grid_root = get_grid_root(obj) if change else None
+        previous_bounds = grid_root.get_grid_bounds() if grid_root else {}
         super().save_model(request, obj, form, change)
-        obj.sanitize_children()
+        grid_root = grid_root or get_grid_root(obj)
+        if grid_root:
+            grid_root.sanitize_grid(previous_bounds, app_settings.CMSPLUGIN_CASCADE['bootstrap4']['defer_sanitize'])
 
     @classmethod
     def sanitize_model(cls, obj):
@@ -1,9 +1,13 @@
-from copy import copy
+from array import array
 from enum import Enum, unique
-from functools import reduce
+from functools import lru_cache
 import itertools
-from operator import add
+import math
 import re
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from django.utils.translation import gettext_lazy as _
 
@@ -36,16 +40,16 @@ class Breakpoint(Enum):
         return itertools.islice(cls, first, last)
 
     def __gt__(self, other):
-        return self.value > other.value
+        return self._value_ > other._value_
 
     def __ge__(self, other):
-        return self.value >= other.value
+        return self._value_ >= other._value_
 
     def __lt__(self, other):
-        return self.value < other.value
+        return self._value_ < other._value_
 
     def __le__(self, other):
-        return self.value <= other.value
+        return self._value_ <= other._value_
 
     def __iter__(self):
         yield self.xs
@@ -75,6 +79,9 @@ class Breakpoint(Enum):
         ][self.value]
 
 
+_breakpoints = tuple(Breakpoint)
+
+
 class Bound:
     def __init__(self, min, max):
         self.min = float(min)
@@ -123,6 +130,41 @@ fluid_bounds = {
 }
 
 
+FLEX_COLUMN = -1
+AUTO_COLUMN = -2
+
+
+def _build_column_classes():
+    column_classes = {}
+    for bp in Breakpoint:
+        infix = '' if bp == Breakpoint.xs else '-' + bp.name
+        column_classes['col' + infix] = bp, FLEX_COLUMN
+        column_classes['col{}-auto'.format(infix)] = bp, AUTO_COLUMN
+        for units in range(1, 13):
+            column_classes['col{}-{}'.format(infix, units)] = bp, units
+    return column_classes
+
+
+# maps each CSS class specifying the width of a column onto its breakpoint and its fixed units,
+# FLEX_COLUMN or AUTO_COLUMN
+column_classes = _build_column_classes()
+
+_fixed_column_pattern = re.compile(r'^col(?:-(sm|md|lg|xl))?-(\d+)$')
+
+
+def _lookup_column_class(col_class):
+    spec = column_classes.get(col_class)
+    if spec is None:
+        # fixed size columns not contained in the lookup table, such as ``col-013`` or ``col-13``
+        fixed = _fixed_column_pattern.match(col_class)
+        if fixed:
+            units = int(fixed.group(2))
+            if units < 1 or units > 12:
+                raise BootstrapException("Column units value {} out of range".format(units))
+            spec = Breakpoint[fixed.group(1) or 'xs'], units
+    return spec
+
+
 class Break:
     def __init__(self, breakpoint, classes, narrower=None):
         self.breakpoint = breakpoint
@@ -134,39 +176,35 @@ class Break:
             self._inherit_from(narrower)
         self.bound = None
 
+    @property
+    def width_code(self):
+        """
+        The fixed units of this column, ``FLEX_COLUMN``, ``AUTO_COLUMN`` or 0 if unspecified.
+        """
+        if self.flex_column:
+            return FLEX_COLUMN
+        if self.auto_column:
+            return AUTO_COLUMN
+        return self.fixed_units
+
     def _normalize_col_classes(self, classes):
-        if self.breakpoint == Breakpoint.xs:
-            fixed_pat = re.compile(r'^col-(\d+)$')
-            flex_pat = re.compile(r'^col$')
-            auto_pat = re.compile(r'^col-auto$')
-        else:
-            fixed_pat = re.compile(r'^col-{}-(\d+)$'.format(self.breakpoint.name))
-            flex_pat = re.compile(r'^col-{}$'.format(self.breakpoint.name))
-            auto_pat = re.compile(r'^col-{}-auto$'.format(self.breakpoint.name))
         for col_class in classes:
-            # look for CSS classes matching fixed size columns
-            fixed = fixed_pat.match(col_class)
-            if fixed:
-                if self.fixed_units or self.flex_column or self.auto_column:
-                    raise BootstrapException("Can not mix fixed- with flex- or auto-column")
-                units = int(fixed.group(1))
-                if units < 1 or units > 12:
-                    raise BootstrapException("Column units value {} out of range".format(units))
-                self.fixed_units = units
-
-            # look for CSS classes matching flex columns
-            flex = flex_pat.match(col_class)
-            if flex:
+            spec = _lookup_column_class(col_class)
+            if spec is None or spec[0] is not self.breakpoint:
+                continue
+            width_code = spec[1]
+            if width_code == FLEX_COLUMN:
                 if self.fixed_units or self.flex_column or self.auto_column:
                     raise BootstrapException("Can not mix flex- with fixed- or auto-column")
                 self.flex_column = True
-
-            # look for CSS classes matching auto columns
-            auto = auto_pat.match(col_class)
-            if auto:
+            elif width_code == AUTO_COLUMN:
                 if self.fixed_units or self.flex_column or self.auto_column:
                     raise BootstrapException("Can not mix auto- with fixed- or flex-column")
                 self.auto_column = True
+            else:
+                if self.fixed_units or self.flex_column or self.auto_column:
+                    raise BootstrapException("Can not mix fixed- with flex- or auto-column")
+                self.fixed_units = width_code
 
     def _inherit_from(self, narrower):
         if self.breakpoint <= narrower.breakpoint:
@@ -233,40 +271,13 @@ class Bootstrap4Row(list):
 
     def compute_column_bounds(self):
         assert isinstance(self.bounds, dict), "Expected `bounds` to be a dict."
-        for bp in [Breakpoint.xs, Breakpoint.sm, Breakpoint.md, Breakpoint.lg, Breakpoint.xl]:
-            if bp in self.bounds:
-                remaining_width = copy(self.bounds[bp])
-
-            # first compute the bounds of columns with a fixed width
-            for column in self:
-                if column.breaks[bp].fixed_units:
-                    assert column.breaks[bp].bound is None, "Expected `column.breaks[bp].bound` to be None."
-                    column.breaks[bp].bound = Bound(
-                        column.breaks[bp].fixed_units * self.bounds[bp].min / 12,
-                        column.breaks[bp].fixed_units * self.bounds[bp].max / 12,
-                    )
-                    remaining_width -= column.breaks[bp].bound
-
-            flex_columns = reduce(add, [int(col.breaks[bp].flex_column) for col in self], 0)
-            auto_columns = reduce(add, [int(col.breaks[bp].auto_column) for col in self], 0)
-            if auto_columns:
-                # we use auto-columns, therefore estimate the min- and max values
-                for column in self:
-                    if column.breaks[bp].flex_column or column.breaks[bp].auto_column:
-                        assert column.breaks[bp].bound is None, "Expected `column.breaks[bp].bound` to be None."
-                        column.breaks[bp].bound = Bound(
-                            30,
-                            remaining_width.max - 30 * (flex_columns + auto_columns),
-                        )
-            else:
-                # we use flex-columns exclusively, therefore subdivide the remaining width
-                for column in self:
-                    if column.breaks[bp].flex_column:
-                        assert column.breaks[bp].bound is None, "Expected `column.breaks[bp].bound` to be None."
-                        column.breaks[bp].bound = Bound(
-                            remaining_width.min / flex_columns,
-                            remaining_width.max / flex_columns,
-                        )
+        width_codes = array('b', [brk.width_code for column in self for brk in column.breaks.values()])
+        minima, maxima = compute_bounds(width_codes, self.bounds)
+        offset = 0
+        for column in self:
+            for brk in column.breaks.values():
+                brk.bound = None if math.isnan(minima[offset]) else Bound(minima[offset], maxima[offset])
+                offset += 1
 
 
 class Bootstrap4Column(list):
@@ -283,9 +294,8 @@ class Bootstrap4Column(list):
             classes = classes.split()
         narrower = None
         self.breaks = {}
-        for bp in Breakpoint:
-            self.breaks[bp] = Break(bp, classes, narrower)
-            narrower = self.breaks[bp]
+        for bp in _breakpoints:
+            self.breaks[bp] = narrower = Break(bp, classes, narrower)
 
     def __repr__(self):
         return "<{}: {}>".format(self.__class__.__name__, ', '.join([repr(self.breaks[bp]) for bp in Breakpoint]))
@@ -321,3 +331,127 @@ class Bootstrap4Column(list):
         for bp in Breakpoint:
             bound.extend(self.get_bound(bp))
         return {'min': bound.min, 'max': bound.max}
+
+
+def _get_row_limits(bounds):
+    """
+    Return the minimum and maximum widths of a row for each breakpoint. Breakpoints missing in
+    ``bounds`` use the limits of their nearest narrower breakpoint, or NaN if there is none.
+    """
+    row_min, row_max = array('d', [math.nan]) * 5, array('d', [math.nan]) * 5
+    for index, bp in enumerate(_breakpoints):
+        bound = bounds.get(bp)
+        if bound is not None:
+            row_min[index], row_max[index] = bound.min, bound.max
+        elif index > 0:
+            row_min[index], row_max[index] = row_min[index - 1], row_max[index - 1]
+    return row_min, row_max
+
+
+def _compute_bounds_numpy(width_codes, row_min, row_max):
+    codes = numpy.frombuffer(width_codes, dtype=numpy.int8).reshape(-1, 5)
+    row_min, row_max = numpy.array(row_min), numpy.array(row_max)
+    units = numpy.where(codes > 0, codes, 0)
+    remaining = 1.0 - units.sum(axis=0) / 12
+    flex, auto = codes == FLEX_COLUMN, codes == AUTO_COLUMN
+    num_flex, num_auto = flex.sum(axis=0), auto.sum(axis=0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        flex_min, flex_max = row_min * remaining / num_flex, row_max * remaining / num_flex
+    auto_max = row_max * remaining - 30 * (num_flex + num_auto)
+    # with auto-columns, estimate the min- and max values, otherwise subdivide the remaining width
+    with_auto = num_auto > 0
+    minima = numpy.where(flex | auto, numpy.where(with_auto, 30.0, flex_min), units * row_min / 12)
+    maxima = numpy.where(flex | auto, numpy.where(with_auto, auto_max, flex_max), units * row_max / 12)
+    unspecified = (codes == 0) | numpy.isnan(row_min)
+    minima[unspecified] = maxima[unspecified] = numpy.nan
+    return array('d', minima.ravel().tolist()), array('d', maxima.ravel().tolist())
+
+
+def _compute_bounds_python(width_codes, row_min, row_max):
+    minima, maxima = array('d', [math.nan]) * len(width_codes), array('d', [math.nan]) * len(width_codes)
+    for bp in range(5):
+        if math.isnan(row_min[bp]):
+            continue
+        codes = width_codes[bp::5]
+        remaining = 1.0 - sum(code for code in codes if code > 0) / 12
+        num_flex, num_auto = codes.count(FLEX_COLUMN), codes.count(AUTO_COLUMN)
+        for offset, code in zip(range(bp, len(width_codes), 5), codes):
+            if code > 0:
+                minima[offset], maxima[offset] = code * row_min[bp] / 12, code * row_max[bp] / 12
+            elif code and num_auto:
+                minima[offset], maxima[offset] = 30.0, row_max[bp] * remaining - 30 * (num_flex + num_auto)
+            elif code:
+                minima[offset], maxima[offset] = row_min[bp] * remaining / num_flex, row_max[bp] * remaining / num_flex
+    return minima, maxima
+
+
+# below this number of columns, the overhead of calling NumPy exceeds its gain
+NUMPY_MIN_COLUMNS = 32
+
+
+def compute_bounds(width_codes, bounds):
+    """
+    Compute the bounds of all columns of a row in a few array operations, using NumPy if available
+    and the row contains at least ``NUMPY_MIN_COLUMNS`` columns.
+
+    :param width_codes: Packed array of type ``'b'`` containing, for each column of the row, the
+        fixed units, ``FLEX_COLUMN``, ``AUTO_COLUMN`` or 0 for each of the five breakpoints.
+    :param bounds: Dict of ``Bound`` objects for each breakpoint of the row.
+    :return: Two arrays of type ``'d'`` containing the minimum and maximum widths of each column,
+        laid out as ``width_codes``. Widths of columns not specified for a breakpoint are NaN.
+    """
+    row_min, row_max = _get_row_limits(bounds)
+    if numpy is not None and len(width_codes) >= 5 * NUMPY_MIN_COLUMNS:
+        return _compute_bounds_numpy(width_codes, row_min, row_max)
+    return _compute_bounds_python(width_codes, row_min, row_max)
+
+
+@lru_cache(maxsize=4096)
+def _get_width_codes(classes):
+    return [brk.width_code for brk in Bootstrap4Column(list(classes)).breaks.values()]
+
+
+@lru_cache(maxsize=4096)
+def _compute_column_bounds(row_bounds, column_classes):
+    """
+    Return the bounds ``(min, max)`` of each column for each breakpoint, or None if a column does
+    not specify its width for that breakpoint. Since many rows share the same bounds and columns,
+    results are memoized.
+    """
+    width_codes = array('b', [code for classes in column_classes for code in _get_width_codes(classes)])
+    bounds = {Breakpoint(bp): Bound(min, max) for bp, min, max in row_bounds}
+    minima, maxima = compute_bounds(width_codes, bounds)
+    return tuple(tuple(None if math.isnan(minima[offset]) else (minima[offset], maxima[offset])
+                       for offset in range(first, first + 5)) for first in range(0, len(width_codes), 5))
+
+
+def solve_grid(bounds, rows):
+    """
+    Compute the bounds of all rows and columns inside a container in one top-down pass.
+
+    :param bounds: Dict of ``Bound`` objects for each breakpoint of the container.
+    :param rows: List of ``(key, columns)`` tuples, one for each row inside the container, where
+        ``columns`` is a list of ``(key, classes, rows)`` tuples, one for each column of that row,
+        and ``rows`` again is the list of rows nested inside that column.
+    :return: A tuple containing the ``Bootstrap4Container`` and a dict mapping the key of each
+        row and column onto its ``Bootstrap4Row`` or ``Bootstrap4Column`` instance.
+    """
+    container = Bootstrap4Container(bounds=bounds)
+    instances = {}
+
+    def add_rows(parent, rows):
+        for row_key, columns in rows:
+            row = instances[row_key] = parent.add_row(Bootstrap4Row())
+            row_bounds = tuple((bp.value, bound.min, bound.max) for bp, bound in row.bounds.items())
+            column_classes = tuple(tuple(classes) for _, classes, _ in columns)
+            for (column_key, classes, nested_rows), column_bounds in zip(
+                    columns, _compute_column_bounds(row_bounds, column_classes)):
+                column = instances[column_key] = Bootstrap4Column(classes)
+                row.add_column(column)
+                for bp, bound in zip(Breakpoint, column_bounds):
+                    if bound:
+                        column.breaks[bp].bound = Bound(*bound)
+                add_rows(column, nested_rows)
+
+    add_rows(container, rows)
+    return container, instances
@@ -4,6 +4,7 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
 from cms.plugin_pool import plugin_pool
+from cmsplugin_cascade.bootstrap4.container import get_grid_column
 from cmsplugin_cascade.bootstrap4.grid import Breakpoint
 from cmsplugin_cascade.bootstrap4.utils import get_image_tags, IMAGE_RESIZE_OPTIONS, IMAGE_SHAPE_CHOICES
 from cmsplugin_cascade.image import ImageFormMixin, ImagePropertyMixin
@@ -100,8 +101,7 @@ class BootstrapImagePlugin(LinkPluginBase):
         else:
             extra_styles = image_tags.pop('extra_styles', None)
             if extra_styles:
-                inline_styles = instance.glossary.get('inline_styles', {})
-                inline_styles.update(extra_styles)
+                inline_styles = dict(instance.glossary.get('inline_styles', {}), **extra_styles)
                 instance.glossary['inline_styles'] = inline_styles
             context.update(dict(**image_tags))
         return context
@@ -125,11 +125,8 @@ class BootstrapImagePlugin(LinkPluginBase):
     @classmethod
     def sanitize_model(cls, obj):
         sanitized = False
-        parent = obj.parent
         try:
-            while parent.plugin_type != 'BootstrapColumnPlugin':
-                parent = parent.parent
-            grid_column = parent.get_bound_plugin().get_grid_instance()
+            grid_column = get_grid_column(obj)
             min_max_bounds = grid_column.get_min_max_bounds()
             if obj.glossary.get('column_bounds') != min_max_bounds:
                 obj.glossary['column_bounds'] = min_max_bounds
@@ -4,6 +4,7 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
 from cms.plugin_pool import plugin_pool
+from cmsplugin_cascade.bootstrap4.container import get_grid_column
 from cmsplugin_cascade.bootstrap4.grid import Breakpoint
 from cmsplugin_cascade.bootstrap4.utils import get_picture_elements, IMAGE_RESIZE_OPTIONS, IMAGE_SHAPE_CHOICES
 from cmsplugin_cascade.bootstrap4.fields import BootstrapMultiSizeField
@@ -107,11 +108,8 @@ class BootstrapPicturePlugin(LinkPluginBase):
     @classmethod
     def sanitize_model(cls, obj):
         sanitized = False
-        parent = obj.parent
-        if parent:
-            while parent.plugin_type != 'BootstrapColumnPlugin':
-                parent = parent.parent
-            grid_column = parent.get_bound_plugin().get_grid_instance()
+        grid_column = get_grid_column(obj)
+        if grid_column is not None:
             obj.glossary.setdefault('media_queries', {})
             for bp in Breakpoint:
                 obj.glossary['media_queries'].setdefault(bp.name, {})
@@ -29,6 +29,7 @@ def set_defaults(config):
         (Breakpoint.xl, Bound(1200, 1980)),
     ]))
     config['bootstrap4'].setdefault('gutter', 30)
+    config['bootstrap4'].setdefault('defer_sanitize', False)
 
     config['plugins_with_extra_mixins'].setdefault('BootstrapAccordionPlugin', BootstrapUtilities(
         BootstrapUtilities.margins,
@@ -0,0 +1,200 @@
+"""
+Bundles of stride trees exported from the published pages and static placeholders of a site.
+Nodes without access to the database can serve those pages using ``StrideBundleMiddleware``.
+
+A bundle is a directory named after its version, containing a file ``manifest.json`` and the
+stride trees of all placeholders in its subdirectory ``trees``. Identical trees are stored only
+once. The manifest maps the path of each page, as found in ``request.path_info``, onto its language,
+title, template and the stride trees of its placeholders. The file ``CURRENT`` next to the bundles contains the version in use.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+from django.contrib.admin import site as default_admin_site
+from django.shortcuts import render
+from django.template.context import make_context
+from django.urls import get_script_prefix
+from django.utils import translation
+
+from sekizai.context_processors import sekizai
+
+from cmsplugin_cascade import app_settings
+from cmsplugin_cascade.strides import StrideContentRenderer, stride_trees
+
+__all__ = ['export_bundle', 'get_current_bundle', 'StrideBundle', 'StrideBundleMiddleware']
+
+BUNDLE_FORMAT = 1
+
+
+def _write_json(filename, data):
+    temp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+    with io.open(temp_filename, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp, sort_keys=True)
+    os.replace(temp_filename, filename)
+
+
+def export_bundle(bundle_root, version, site, languages, admin_site=default_admin_site, stdout=None):
+    """
+    Export the published pages and static placeholders of the given site and languages into a
+    bundle of stride trees, stored as ``bundle_root/version``, and make it the current bundle.
+    """
+    from cms.models import Page, StaticPlaceholder
+    from cmsplugin_cascade.clipboard.utils import serialize_from_placeholder
+
+    trees_dir = os.path.join(bundle_root, version, 'trees')
+    os.makedirs(trees_dir, exist_ok=True)
+
+    def export_tree(placeholder, language):
+        tree_data = serialize_from_placeholder(placeholder, admin_site, language)
+        if not tree_data['plugins']:
+            return
+        content = json.dumps(tree_data, sort_keys=True)
+        name = 'trees/{}.json'.format(hashlib.sha1(content.encode('utf-8')).hexdigest())
+        filename = os.path.join(bundle_root, version, name)
+        if not os.path.exists(filename):
+            _write_json(filename, tree_data)
+        return name
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'created': time.time(),
+        'site': site.pk,
+        'pages': {},
+        'static_placeholders': {},
+    }
+    for page in Page.objects.public().published(site=site):
+        placeholders = list(page.get_placeholders())
+        for language in page.get_published_languages():
+            if language not in languages:
+                continue
+            url = get_path_info(page.get_absolute_url(language, fallback=False))
+            manifest['pages'][url] = {
+                'language': language,
+                'title': page.get_title(language, fallback=False),
+                'template': page.get_template(),
+                'placeholders': [[p.slot, tree] for p in placeholders for tree in [export_tree(p, language)] if tree],
+            }
+            if stdout:
+                stdout.write("Exported page {}".format(url))
+    for static_placeholder in StaticPlaceholder.objects.filter(site__in=[None, site]):
+        for language in languages:
+            tree = export_tree(static_placeholder.public, language)
+            if tree:
+                manifest['static_placeholders'].setdefault(static_placeholder.code, {})[language] = tree
+
+    _write_json(os.path.join(bundle_root, version, 'manifest.json'), manifest)
+    with io.open(os.path.join(bundle_root, 'CURRENT.tmp'), 'w') as fp:
+        fp.write(version)
+    os.replace(os.path.join(bundle_root, 'CURRENT.tmp'), os.path.join(bundle_root, 'CURRENT'))
+    return manifest
+
+
+class StrideBundle:
+    """
+    A bundle of stride trees, as exported by the management command ``export_strides``.
+    """
+    def __init__(self, path):
+        self.path = path
+        with io.open(os.path.join(path, 'manifest.json'), encoding='utf-8') as fp:
+            self.manifest = json.load(fp)
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError("Unsupported format of stride bundle: {}".format(path))
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    def get_page(self, url):
+        return self.manifest['pages'].get(url)
+
+    def get_tree(self, name):
+        return stride_trees.get_tree(os.path.join(self.path, name))
+
+    def render_trees(self, context, trees):
+        renderer = StrideContentRenderer(context['request'])
+        renderer.language = translation.get_language()
+        return {key: renderer.render_cascade(context, self.get_tree(name)) for key, name in trees}
+
+    def render_page(self, request, entry):
+        """
+        Render the page described by the given entry of the manifest. The template configured in
+        ``CMSPLUGIN_CASCADE['stride_bundle_templates']`` for the page's CMS template, receives the
+        rendered placeholders as ``placeholders`` and the static placeholders as ``static_placeholders``,
+        both as dictionaries.
+        """
+        language = entry['language']
+        with translation.override(language):
+            context = make_context(dict(sekizai(request), request=request), request)
+            static_trees = ((code, trees[language]) for code, trees in self.manifest['static_placeholders'].items()
+                            if language in trees)
+            context.update({
+                'language': language,
+                'title': entry['title'],
+                'placeholders': self.render_trees(context, entry['placeholders']),
+                'static_placeholders': self.render_trees(context, static_trees),
+            })
+            templates = app_settings.CMSPLUGIN_CASCADE['stride_bundle_templates']
+            template_name = templates.get(entry['template'], templates.get(None))
+            return render(request, template_name, context.flatten())
+
+
+_current_bundle = None
+_bundles_lock = threading.Lock()
+
+
+def get_current_bundle():
+    """
+    Return the current bundle inside the directory ``CMSPLUGIN_CASCADE['stride_bundle_root']``,
+    or None if there is none. The file ``CURRENT`` is read again only after it has been replaced.
+    """
+    global _current_bundle
+
+    bundle_root = app_settings.CMSPLUGIN_CASCADE['stride_bundle_root']
+    if not bundle_root:
+        return
+    current_file = os.path.join(bundle_root, 'CURRENT')
+    try:
+        stat = os.stat(current_file)
+    except FileNotFoundError:
+        return
+    signature = bundle_root, stat.st_ino, stat.st_mtime_ns, stat.st_size
+    with _bundles_lock:
+        if _current_bundle is None or _current_bundle[0] != signature:
+            with io.open(current_file) as fp:
+                version = fp.read().strip()
+            _current_bundle = signature, StrideBundle(os.path.join(bundle_root, version))
+        return _current_bundle[1]
+
+
+def get_path_info(url):
+    """
+    Return the given URL as found in ``request.path_info``, that is without the script prefix of a
+    site running under a sub-path.
+    """
+    script_prefix = get_script_prefix()
+    if url.startswith(script_prefix):
+        return '/' + url[len(script_prefix):]
+    return url
+
+
+class StrideBundleMiddleware:
+    """
+    Serve the pages contained in the current stride bundle without accessing the database. Add
+    this middleware in front of all other middlewares which may access the database. Requests
+    for URLs not contained in the bundle are passed on.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD'):
+            bundle = get_current_bundle()
+            entry = bundle.get_page(request.path_info) if bundle else None
+            if entry:
+                return bundle.render_page(request, entry)
+        return self.get_response(request)
@@ -10,15 +10,17 @@ from djangocms_text_ckeditor.models import Text
 from djangocms_text_ckeditor.utils import plugin_tags_to_id_list, replace_plugin_tags
 
 from cmsplugin_cascade.models import CascadeElement
+from cmsplugin_cascade.models_base import load_placeholder_tree
 
 
-def serialize_from_placeholder(placeholder, admin_site=default_admin_site):
+def serialize_from_placeholder(placeholder, admin_site=default_admin_site, language=None):
     """
     Create a serialized representation of all the plugins belonging to the clipboard.
+    If a language is given, only plugins of that language are serialized.
     """
-    def populate_data(parent, data):
-        for child in plugin_qs.filter(parent=parent).order_by('position'):
-            instance, plugin = child.get_plugin_instance(admin_site)
+    def populate_data(instances, data):
+        for instance in instances:
+            plugin = instance.get_plugin_class_instance(admin_site)
             plugin_type = plugin.__class__.__name__
             try:
                 entry = (plugin_type, plugin.get_data_representation(instance), [])
@@ -28,11 +30,10 @@ def serialize_from_placeholder(placeholder, admin_site=default_admin_site):
                 else:
                     continue
             data.append(entry)
-            populate_data(child, entry[2])
+            populate_data(instance.child_plugin_instances, entry[2])
 
     data = {'plugins': []}
-    plugin_qs = placeholder.cmsplugin_set.all()
-    populate_data(None, data['plugins'])
+    populate_data(load_placeholder_tree(placeholder, language), data['plugins'])
     return data
 
 
@@ -0,0 +1,298 @@
+"""
+Stores for the rendered fragments of stride elements. The store to use is configured through
+``CMSPLUGIN_CASCADE['stride_fragment_store']``.
+
+Each fragment is stored together with the moment until which it is considered fresh and the
+time it took to render. If ``CMSPLUGIN_CASCADE['stride_fragments_stale_timeout']`` is set,
+fragments are kept that many seconds longer and returned as ``StaleFragment`` afterwards, so that
+they can be served while one process refreshes them. If
+``CMSPLUGIN_CASCADE['stride_fragments_early_expiry_beta']`` is set, fragments are randomly
+considered stale shortly before they expire, the more likely the longer they took to render.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from cmsplugin_cascade import app_settings
+
+__all__ = ['StaleFragment', 'SharedFragmentStore', 'TwoTierFragmentStore', 'get_fragment_store']
+
+
+async def call_cache(method_name, *args, **kwargs):
+    """
+    Await the asynchronous variant of a method of the default cache, as provided since Django 4.0.
+    With older versions of Django, its synchronous variant is run on a thread instead, hence there
+    awaiting this does not avoid blocking a thread of the executor.
+    """
+    cache = caches['default']
+    method = getattr(cache, 'a' + method_name, None)
+    if method is None:
+        method = sync_to_async(getattr(cache, method_name), thread_sensitive=False)
+    return await method(*args, **kwargs)
+
+
+class StaleFragment(tuple):
+    """
+    A fragment ``(content, sekizai_blocks)``, which shall be refreshed, but may still be served.
+    """
+
+
+class SharedFragmentStore:
+    """
+    Keep the rendered fragments in Django's default cache, shared among all processes.
+    """
+    tiers = ('shared',)
+    lock_poll_interval = 0.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def get_many(self, keys):
+        return self._unwrap_entries(self._get_entries(keys))
+
+    def set_many(self, fragments, durations=None):
+        timeout = self._get_timeout()
+        self._set_entries(self._wrap_fragments(fragments, durations), timeout)
+
+    async def aget_many(self, keys):
+        return self._unwrap_entries(await self._aget_entries(keys))
+
+    async def aset_many(self, fragments, durations=None):
+        timeout = self._get_timeout()
+        await self._aset_entries(self._wrap_fragments(fragments, durations), timeout)
+
+    def acquire(self, key):
+        """
+        Try to acquire the lock for rendering the fragment of the given key. Only the process holding
+        that lock shall render it, while the others serve its stale content or wait for it. Return a
+        token identifying the owner of the lock, or None if it is held by another process. If
+        ``CMSPLUGIN_CASCADE['stride_fragments_lock_timeout']`` is not set, locking is disabled.
+        """
+        lock_timeout = app_settings.CMSPLUGIN_CASCADE['stride_fragments_lock_timeout']
+        if not lock_timeout:
+            return True
+        token = uuid.uuid4().hex
+        if caches['default'].add(self._get_lock_key(key), token, lock_timeout):
+            return token
+
+    def release(self, locks):
+        """
+        Release the locks given as dict mapping keys onto the tokens returned by ``acquire()``.
+        Locks which expired meanwhile and have been acquired by another process, are left alone.
+        """
+        lock_tokens = self._get_lock_tokens(locks)
+        if lock_tokens:
+            owned_keys = self._get_owned_lock_keys(lock_tokens, caches['default'].get_many(list(lock_tokens)))
+            if owned_keys:
+                caches['default'].delete_many(owned_keys)
+
+    async def arelease(self, locks):
+        lock_tokens = self._get_lock_tokens(locks)
+        if lock_tokens:
+            owned_keys = self._get_owned_lock_keys(lock_tokens, await call_cache('get_many', list(lock_tokens)))
+            if owned_keys:
+                await call_cache('delete_many', owned_keys)
+
+    def wait(self, key):
+        """
+        Wait until the process holding the lock has rendered the fragment of the given key. Return
+        that fragment, or None if it does not appear before the lock expires.
+        """
+        deadline = time.monotonic() + app_settings.CMSPLUGIN_CASCADE['stride_fragments_lock_timeout']
+        while time.monotonic() < deadline:
+            time.sleep(self.lock_poll_interval)
+            fragment = self.get_many([key]).get(key)
+            if fragment is not None:
+                return fragment
+
+    def get_stats(self):
+        """
+        Return the number of hits and misses for each tier, for monitoring purposes.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'{}_{}'.format(tier, kind): 0 for tier in self.tiers for kind in ('hits', 'misses')}
+
+    def _get_entries(self, keys):
+        entries = caches['default'].get_many(keys)
+        self._count('shared', len(entries), len(keys) - len(entries))
+        return entries
+
+    def _set_entries(self, entries, timeout):
+        caches['default'].set_many(entries, timeout=timeout)
+
+    async def _aget_entries(self, keys):
+        entries = await call_cache('get_many', keys)
+        self._count('shared', len(entries), len(keys) - len(entries))
+        return entries
+
+    async def _aset_entries(self, entries, timeout):
+        await call_cache('set_many', entries, timeout=timeout)
+
+    def _count(self, tier, hits, misses):
+        with self._lock:
+            self._stats[tier + '_hits'] += hits
+            self._stats[tier + '_misses'] += misses
+
+    @staticmethod
+    def _get_lock_key(key):
+        return 'cascade_lock:' + key
+
+    def _get_lock_tokens(self, locks):
+        # locks acquired while locking was disabled, have no token
+        return {self._get_lock_key(key): token for key, token in locks.items() if token is not True}
+
+    @staticmethod
+    def _get_owned_lock_keys(lock_tokens, current_tokens):
+        # Django's cache API offers no atomic compare-and-delete, hence this narrows the race to one round-trip
+        return [lock_key for lock_key, token in lock_tokens.items() if current_tokens.get(lock_key) == token]
+
+    @staticmethod
+    def _get_fresh_timeout():
+        timeout = app_settings.CMSPLUGIN_CASCADE['stride_fragments_timeout']
+        if timeout is None:
+            timeout = caches['default'].default_timeout
+        return timeout
+
+    def _get_timeout(self):
+        fresh_timeout = self._get_fresh_timeout()
+        if fresh_timeout is None:
+            return None
+        return fresh_timeout + app_settings.CMSPLUGIN_CASCADE['stride_fragments_stale_timeout']
+
+    def _wrap_fragments(self, fragments, durations):
+        fresh_timeout = self._get_fresh_timeout()
+        fresh_until = None if fresh_timeout is None else time.time() + fresh_timeout
+        durations = durations or {}
+        return {key: (content, sekizai_blocks, fresh_until, durations.get(key, 0))
+                for key, (content, sekizai_blocks) in fragments.items()}
+
+    @staticmethod
+    def _unwrap_entries(entries):
+        beta = app_settings.CMSPLUGIN_CASCADE['stride_fragments_early_expiry_beta']
+        now, fragments = time.time(), {}
+        for key, (content, sekizai_blocks, fresh_until, duration) in entries.items():
+            if fresh_until is not None and beta:
+                # probabilistic early expiration, the log of a random number in (0, 1] is negative
+                fresh_until += duration * beta * math.log(1.0 - random.random())
+            if fresh_until is None or now < fresh_until:
+                fragments[key] = content, sekizai_blocks
+            else:
+                fragments[key] = StaleFragment((content, sekizai_blocks))
+        return fragments
+
+
+class TwoTierFragmentStore(SharedFragmentStore):
+    """
+    Keep recently used fragments in a bounded LRU inside the current process, in front of
+    Django's default cache. Entries in the local tier expire after a short timeout, and the LRU
+    is bounded by its number of entries and by the total length of the fragments it contains.
+    There is no need to invalidate the local tier explicitly: Each key contains the generation
+    of its stride file, which is kept in the shared tier. Hence after ``invalidate_stride()``,
+    all processes look up keys of the new generation.
+    """
+    tiers = ('local', 'shared')
+
+    def __init__(self):
+        super().__init__()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _get_entries(self, keys):
+        entries = self._get_local(keys)
+        missing_keys = [key for key in keys if key not in entries]
+        if missing_keys:
+            shared_entries = super()._get_entries(missing_keys)
+            self._set_local(shared_entries)
+            entries.update(shared_entries)
+        return entries
+
+    def _set_entries(self, entries, timeout):
+        super()._set_entries(entries, timeout)
+        self._set_local(entries)
+
+    async def _aget_entries(self, keys):
+        entries = self._get_local(keys)
+        missing_keys = [key for key in keys if key not in entries]
+        if missing_keys:
+            shared_entries = await super()._aget_entries(missing_keys)
+            self._set_local(shared_entries)
+            entries.update(shared_entries)
+        return entries
+
+    async def _aset_entries(self, entries, timeout):
+        await super()._aset_entries(entries, timeout)
+        self._set_local(entries)
+
+    def _get_local(self, keys):
+        entries, now = {}, time.monotonic()
+        with self._lock:
+            for key in keys:
+                try:
+                    expires, size, entry = self._entries[key]
+                except KeyError:
+                    continue
+                if expires < now:
+                    self._remove(key)
+                    continue
+                self._entries.move_to_end(key)
+                entries[key] = entry
+        self._count('local', len(entries), len(keys) - len(entries))
+        return entries
+
+    def _set_local(self, entries):
+        config = app_settings.CMSPLUGIN_CASCADE
+        expires = time.monotonic() + config['stride_fragments_local_timeout']
+        with self._lock:
+            for key, entry in entries.items():
+                size = self._get_size(entry)
+                if size > config['stride_fragments_local_maxbytes']:
+                    continue
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = expires, size, entry
+                self._size += size
+            while self._entries and (len(self._entries) > config['stride_fragments_local_maxsize']
+                                     or self._size > config['stride_fragments_local_maxbytes']):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key)[1]
+
+    @staticmethod
+    def _get_size(entry):
+        content, sekizai_blocks = entry[:2]
+        return len(content) + sum(len(item) for data in sekizai_blocks.values() for item in data)
+
+
+_fragment_store = None
+_fragment_store_lock = threading.Lock()
+
+
+def get_fragment_store():
+    """
+    Return the fragment store of this process, as configured by ``CMSPLUGIN_CASCADE['stride_fragment_store']``.
+    """
+    global _fragment_store
+
+    store_class = app_settings.CMSPLUGIN_CASCADE['stride_fragment_store']
+    with _fragment_store_lock:
+        if _fragment_store is None or _fragment_store[0] != store_class:
+            _fragment_store = store_class, import_string(store_class)()
+        return _fragment_store[1]
@@ -0,0 +1,26 @@
+import os
+
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+from cmsplugin_cascade.binary_strides import compile_stride
+
+
+class Command(BaseCommand):
+    help = "Compile stride files from JSON into the memory mappable binary format."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'datafiles',
+            nargs='+',
+            help="Stride files in JSON format, given as path locatable by the static files finders.",
+        )
+
+    def handle(self, *args, **options):
+        for datafile in options['datafiles']:
+            source = finders.find(datafile)
+            if not source:
+                raise CommandError("Unable to find file: {}".format(datafile))
+            target = os.path.splitext(source)[0] + '.stride'
+            compile_stride(source, target)
+            self.stdout.write("Compiled {} into {}".format(datafile, target))
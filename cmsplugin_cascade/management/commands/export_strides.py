@@ -0,0 +1,42 @@
+import os
+import time
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from cmsplugin_cascade import app_settings
+from cmsplugin_cascade.bundle import export_bundle
+
+
+class Command(BaseCommand):
+    help = "Export all published pages and static placeholders into a bundle of stride trees."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--root',
+            default=app_settings.CMSPLUGIN_CASCADE['stride_bundle_root'],
+            help="Directory containing the bundles. Defaults to CMSPLUGIN_CASCADE['stride_bundle_root'].",
+        )
+        parser.add_argument(
+            '--bundle-version',
+            dest='bundle_version',
+            default=None,
+            help="Version of the bundle. Defaults to the current date and time.",
+        )
+        parser.add_argument(
+            '--language',
+            dest='languages',
+            action='append',
+            help="Export only this language. May be given more than once.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['root']:
+            raise CommandError("No directory given for the stride bundles.")
+        version = options['bundle_version'] or time.strftime('%Y%m%d%H%M%S')
+        if os.path.exists(os.path.join(options['root'], version)):
+            raise CommandError("A bundle with version {} already exists.".format(version))
+        languages = options['languages'] or [code for code, _ in settings.LANGUAGES]
+        manifest = export_bundle(options['root'], version, Site.objects.get_current(), languages, stdout=self.stdout)
+        self.stdout.write("Exported {} pages into bundle {}".format(len(manifest['pages']), version))
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import time
+from collections import Counter
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from cms.models import CMSPlugin, Placeholder
+from cms.plugin_pool import plugin_pool
+from cmsplugin_cascade.bootstrap4.container import get_grid_filter
+from cmsplugin_cascade.models_base import (CascadeModelBase, bulk_update_glossaries, load_placeholder_tree,
+                                           sanitize_plugins)
+
+
+def resanitize_placeholders(placeholder_ids, dry_run=False, batch_size=None):
+    """
+    Sanitize all Cascade elements of the given placeholders and write the changed glossaries back,
+    unless ``dry_run`` is set. Return the number of sanitized elements, the number of changed
+    elements by plugin type and the number of changes by glossary key.
+    """
+    num_plugins, changed_plugins, changed_keys = 0, Counter(), Counter()
+    changed = []
+    for placeholder in Placeholder.objects.filter(pk__in=placeholder_ids):
+        filter_plugin = get_grid_filter()
+
+        def count_plugin(plugin):
+            nonlocal num_plugins
+            num_plugins += 1
+            return filter_plugin(plugin)
+
+        for plugin in sanitize_plugins(load_placeholder_tree(placeholder), count_plugin):
+            changed_plugins[plugin.plugin_type] += 1
+            changed_keys.update(plugin.get_changed_glossary_keys())
+            if not dry_run:
+                changed.append(plugin)
+    if changed:
+        with transaction.atomic():
+            bulk_update_glossaries(changed, batch_size)
+        for placeholder, language in {(plugin.placeholder, plugin.language) for plugin in changed}:
+            placeholder.clear_cache(language)
+    return num_plugins, changed_plugins, changed_keys
+
+
+def _resanitize_chunk(args):
+    placeholder_ids, dry_run, batch_size = args
+    return len(placeholder_ids), resanitize_placeholders(placeholder_ids, dry_run, batch_size)
+
+
+def _init_worker():
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = "Sanitize the Cascade elements of all placeholders, for instance after changing the Bootstrap bounds."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only count the elements which would change, without writing them.",
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes. Defaults to the number of CPUs.",
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=20,
+            help="Number of placeholders handed over to a worker process at once.",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Maximum number of elements written by one query.",
+        )
+
+    def handle(self, *args, **options):
+        plugin_types = [plugin.__name__ for plugin in plugin_pool.get_all_plugins()
+                        if issubclass(plugin.model, CascadeModelBase)]
+        placeholder_ids = sorted(set(CMSPlugin.objects.filter(plugin_type__in=plugin_types).values_list(
+            'placeholder_id', flat=True)))
+        chunk_size = options['chunk_size']
+        chunks = [(placeholder_ids[k:k + chunk_size], options['dry_run'], options['batch_size'])
+                  for k in range(0, len(placeholder_ids), chunk_size)]
+        if options['processes'] > 1 and len(chunks) > 1:
+            # forked workers must not share the connections of this process
+            connections.close_all()
+            with multiprocessing.Pool(options['processes'], initializer=_init_worker) as pool:
+                changed_plugins, changed_keys = self.collect(pool.imap_unordered(_resanitize_chunk, chunks),
+                                                             len(placeholder_ids))
+        else:
+            changed_plugins, changed_keys = self.collect(map(_resanitize_chunk, chunks), len(placeholder_ids))
+
+        verb = "Would change" if options['dry_run'] else "Changed"
+        for plugin_type, count in sorted(changed_plugins.items()):
+            self.stdout.write("{} {} elements of type {}".format(verb, count, plugin_type))
+        for key, count in sorted(changed_keys.items()):
+            self.stdout.write("{} glossary key '{}' of {} elements".format(verb, key, count))
+
+    def collect(self, results, total):
+        """
+        Sum up the results of all chunks and report the progress after each chunk.
+        """
+        num_placeholders, num_plugins, changed_plugins, changed_keys = 0, 0, Counter(), Counter()
+        start = time.perf_counter()
+        for num_chunk_placeholders, (num_chunk_plugins, chunk_plugins, chunk_keys) in results:
+            num_placeholders += num_chunk_placeholders
+            num_plugins += num_chunk_plugins
+            changed_plugins.update(chunk_plugins)
+            changed_keys.update(chunk_keys)
+            elapsed = time.perf_counter() - start
+            self.stdout.write("Sanitized {}/{} placeholders, {} elements, {} changed ({:.0f} elements/s)".format(
+                num_placeholders, total, num_plugins, sum(changed_plugins.values()), num_plugins / elapsed))
+        return changed_plugins, changed_keys
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cmsplugin_cascade.models import PendingSanitize
+
+
+class Command(BaseCommand):
+    help = "Sanitize the descendants of Bootstrap containers, whose sanitizing has been deferred while editing."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help="Maximum number of containers to process in one run.",
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help="Keep on running and look for pending containers every few seconds.",
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help="Number of seconds to wait between two runs, if looping.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = PendingSanitize.process_pending(limit=options['limit'])
+            if processed or options['verbosity'] > 1:
+                self.stdout.write("Sanitized {} pending containers".format(processed))
+            for pk in failed:
+                self.stderr.write("Unable to sanitize the descendants of plugin {}".format(pk))
+            if not options['loop']:
+                break
+            if options['limit'] is None or processed < options['limit']:
+                time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0022_auto_20180620_1551'),
+        ('cmsplugin_cascade', '0031_alter_texteditorconfigfields_element_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CascadeAncestry',
+            fields=[
+                ('plugin', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cascade_ancestry', serialize=False, to='cms.cmsplugin')),
+                ('path', models.CharField(max_length=255)),
+                ('ancestors', models.JSONField(default=list)),
+                ('column', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='cms.cmsplugin')),
+                ('container', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='cms.cmsplugin')),
+                ('row', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='cms.cmsplugin')),
+            ],
+            options={
+                'verbose_name': 'Ancestry',
+                'verbose_name_plural': 'Ancestries',
+                'db_table': 'cmsplugin_cascade_ancestry',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:19
+
+import cmsplugin_cascade.models_base
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsplugin_cascade', '0032_cascadeancestry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cascadeelement',
+            name='glossary',
+            field=cmsplugin_cascade.models_base.LazyJSONField(blank=True, default=dict),
+        ),
+    ]
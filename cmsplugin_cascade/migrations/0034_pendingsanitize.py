@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0022_auto_20180620_1551'),
+        ('cmsplugin_cascade', '0033_lazy_glossary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSanitize',
+            fields=[
+                ('plugin', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='cms.cmsplugin')),
+                ('previous_bounds', models.JSONField(default=dict)),
+                ('requested', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Pending Sanitize',
+                'verbose_name_plural': 'Pending Sanitizes',
+                'db_table': 'cmsplugin_cascade_pending_sanitize',
+            },
+        ),
+    ]
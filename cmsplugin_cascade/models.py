@@ -1,4 +1,5 @@
 import json
+import logging
 import os
 import shutil
 from collections import OrderedDict
@@ -8,17 +9,23 @@ from pathlib import Path
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
-from django.db import models
+from django.db import connection, models, transaction
+from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 from filer.fields.file import FilerFileField
+from cms import operations
 from cms.extensions import PageExtension
+from cms.models import CMSPlugin
 from cms.extensions.extension_pool import extension_pool
 from cms.plugin_pool import plugin_pool
-from cmsplugin_cascade.models_base import CascadeModelBase
+from cms.signals import post_placeholder_operation
+from cmsplugin_cascade.models_base import CascadeModelBase, LazyGlossaryAttribute
 from cmsplugin_cascade import app_settings
 
+logger = logging.getLogger('cascade')
+
 
 class SharedGlossary(models.Model):
     """
@@ -89,6 +96,38 @@ class CascadeElement(CascadeModelBase):
             init_element(sortinline_element)
 
 
+class MergedGlossaryDescriptor(LazyGlossaryAttribute):
+    """
+    Access the glossary of a sharable element merged with its shared glossary. The merged glossary
+    is built once and kept, until either the element's own glossary or its shared glossary is
+    replaced. The element's own glossary remains unmodified.
+    """
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        glossary = super().__get__(instance, owner)
+        shared_glossary_id = instance.__dict__.get('shared_glossary_id')
+        if shared_glossary_id is None or instance.__dict__.get('_saving_own_glossary'):
+            return glossary
+        merged = instance.__dict__.get('_merged_glossary')
+        if merged and merged[0] is glossary:
+            if merged[1] == shared_glossary_id:
+                return merged[3]
+            # keep modifications applied to the previously merged glossary, but not the previously shared values
+            previous_shared = merged[2]
+            glossary = dict(glossary or {}, **{key: value for key, value in merged[3].items()
+                                               if key not in previous_shared or value != previous_shared[key]})
+        shared_glossary = dict(instance.shared_glossary.glossary)
+        merged_glossary = dict(glossary or {}, **shared_glossary)
+        instance.__dict__['_merged_glossary'] = (instance.__dict__['glossary'], shared_glossary_id, shared_glossary,
+                                                 merged_glossary)
+        return merged_glossary
+
+    def __set__(self, instance, value):
+        super().__set__(instance, value)
+        instance.__dict__.pop('_merged_glossary', None)
+
+
 class SharableCascadeElement(CascadeElement):
     """
     A proxy model which takes care of merging the glossary with its shared instance.
@@ -96,14 +135,35 @@ class SharableCascadeElement(CascadeElement):
     class Meta:
         proxy = True
 
-    def __getattribute__(self, name):
+    glossary = MergedGlossaryDescriptor(CascadeElement._meta.get_field('glossary'))
+
+    def get_own_glossary(self):
+        """
+        Return the element's own glossary with the modifications applied to the merged glossary, but
+        without the values of the shared glossary. Own values of shared keys are kept, so that they
+        reappear after unsharing the element.
+        """
+        if not self.__dict__.get('_merged_glossary'):
+            return super().get_own_glossary()
+        merged_glossary = self.glossary
+        shared_glossary = self.shared_glossary.glossary if self.shared_glossary else {}
+        own_glossary = {key: value for key, value in (self.__dict__['glossary'] or {}).items()
+                        if key in merged_glossary}
+        own_glossary.update((key, value) for key, value in merged_glossary.items()
+                            if key not in shared_glossary or value != shared_glossary[key])
+        return own_glossary
+
+    def save_base(self, *args, **kwargs):
         """
-        Update glossary with content from SharedGlossary model if that exists.
+        Store modifications applied to the merged glossary, but not the values of the shared glossary.
         """
-        attribute = object.__getattribute__(self, name)
-        if name == 'glossary' and self.shared_glossary:
-            attribute.update(self.shared_glossary.glossary)
-        return attribute
+        if self.__dict__.get('_merged_glossary'):
+            self.glossary = self.get_own_glossary()
+        self._saving_own_glossary = True
+        try:
+            super().save_base(*args, **kwargs)
+        finally:
+            del self._saving_own_glossary
 
 
 class InlineCascadeElement(models.Model):
@@ -147,6 +207,246 @@ class SortableInlineCascadeElement(models.Model):
         return ""
 
 
+class CascadeAncestry(models.Model):
+    """
+    The materialized ancestry of a Cascade element. It keeps the nearest container, row and column
+    as indexed fields, and the primary keys and plugin types of all its ancestors from the root
+    down to its parent. This avoids walking up the plugin tree using one query per level.
+
+    The ancestry is created together with its element and rebuilt whenever the element is moved.
+    Since the path of a plugin changes whenever it or one of its ancestors is moved, an ancestry not
+    matching its element's path is outdated and rebuilt on access.
+    """
+    container_types = ['BootstrapContainerPlugin', 'BootstrapJumbotronPlugin']
+    row_types = ['BootstrapRowPlugin']
+    column_types = ['BootstrapColumnPlugin']
+
+    plugin = models.OneToOneField(
+        CMSPlugin,
+        primary_key=True,
+        related_name='cascade_ancestry',
+        on_delete=models.CASCADE,
+    )
+
+    path = models.CharField(
+        max_length=255,
+    )
+
+    container = models.ForeignKey(
+        CMSPlugin,
+        null=True,
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    row = models.ForeignKey(
+        CMSPlugin,
+        null=True,
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    column = models.ForeignKey(
+        CMSPlugin,
+        null=True,
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    ancestors = models.JSONField(
+        default=list,
+    )
+
+    class Meta:
+        db_table = 'cmsplugin_cascade_ancestry'
+        verbose_name = _("Ancestry")
+        verbose_name_plural = _("Ancestries")
+
+    def __str__(self):
+        return ' / '.join(plugin_type for _, plugin_type in self.ancestors)
+
+    def get_nearest(self, *plugin_types):
+        """
+        Return the primary key and plugin type of the nearest ancestor of one of the given plugin
+        types, or ``(None, None)``.
+        """
+        for pk, plugin_type in reversed(self.ancestors):
+            if plugin_type in plugin_types:
+                return pk, plugin_type
+        return None, None
+
+    def get_nearest_element(self, *plugin_types):
+        """
+        Return the instance of the nearest ancestor of one of the given plugin types, or None.
+        The nearest container, row and column are taken from their indexed foreign keys.
+        """
+        for attname, types in self.get_indexed_types():
+            if set(plugin_types) == set(types):
+                pk = getattr(self, attname)
+                indices = [index for index, (ancestor_pk, _) in enumerate(self.ancestors) if ancestor_pk == pk]
+                break
+        else:
+            indices = [index for index, (_, plugin_type) in enumerate(self.ancestors) if plugin_type in plugin_types]
+        if indices:
+            index = indices[-1]
+            element = self.get_element(*self.ancestors[index])
+            # the ancestry of an ancestor is a prefix of our own
+            element.cascade_ancestry = self._build(element, self.ancestors[:index])
+            return element
+
+    @classmethod
+    def get_indexed_types(cls):
+        return [('container_id', cls.container_types), ('row_id', cls.row_types), ('column_id', cls.column_types)]
+
+    @staticmethod
+    def get_element(pk, plugin_type):
+        """
+        Return the plugin instance for the given primary key and plugin type, using a single query.
+        """
+        if pk is not None:
+            return plugin_pool.get_plugin(plugin_type).model.objects.get(pk=pk)
+
+    @classmethod
+    def rebuild(cls, plugin, with_descendants=False):
+        """
+        Rebuild the ancestry of the given plugin and optionally of all its descendants.
+        Return the ancestry of the given plugin.
+        """
+        ancestors = [[p.pk, p.plugin_type] for p in plugin.get_ancestors().order_by('depth')]
+        ancestry = cls._build(plugin, ancestors)
+        ancestries = [ancestry] if plugin.pk else []  # unsaved plugins can't keep their ancestry
+        if with_descendants:
+            paths = {plugin.path: ancestors + [[plugin.pk, plugin.plugin_type]]}
+            for descendant in plugin.get_descendants().order_by('path'):
+                ancestors = paths[descendant.path[:-plugin.steplen]]
+                paths[descendant.path] = ancestors + [[descendant.pk, descendant.plugin_type]]
+                ancestries.append(cls._build(descendant, ancestors))
+        if ancestries:
+            fields = ['path', 'container', 'row', 'column', 'ancestors']
+            with transaction.atomic():
+                # lock the existing rows, and let concurrent rebuilds of missing ones win instead of failing
+                existing = set(cls.objects.select_for_update().filter(
+                    plugin_id__in=[a.plugin_id for a in ancestries]).values_list('plugin_id', flat=True))
+                cls.objects.bulk_update([a for a in ancestries if a.plugin_id in existing], fields)
+                cls.objects.bulk_create([a for a in ancestries if a.plugin_id not in existing], ignore_conflicts=True)
+        return ancestry
+
+    @classmethod
+    def _build(cls, plugin, ancestors):
+        ancestry = cls(plugin_id=plugin.pk, path=plugin.path, ancestors=ancestors)
+        for attname, plugin_types in cls.get_indexed_types():
+            setattr(ancestry, attname, ancestry.get_nearest(*plugin_types)[0])
+        return ancestry
+
+    @classmethod
+    def create_ancestry(cls, sender=None, instance=None, created=False, raw=False, **kwargs):
+        if not (isinstance(sender, type) and issubclass(sender, CascadeModelBase)):
+            return
+        if created and not raw:
+            cls.rebuild(instance)
+
+    @classmethod
+    def move_ancestry(cls, operation=None, **kwargs):
+        if operation in [operations.MOVE_PLUGIN, operations.CUT_PLUGIN] and kwargs.get('plugin'):
+            cls.rebuild(kwargs['plugin'], with_descendants=True)
+
+
+class PendingSanitize(models.Model):
+    """
+    A Bootstrap container or jumbotron whose descendants shall be sanitized by the management
+    command ``sanitize_pending``, rather than while saving the container or one of its columns.
+    This is enabled by ``CMSPLUGIN_CASCADE['bootstrap4']['defer_sanitize']``.
+
+    Repeated edits of the same container are coalesced into one entry, which keeps the bounds of
+    its grid before the first of these edits. Until that entry has been processed, the elements
+    inside the container are rendered using the ``media_queries`` and ``column_bounds`` stored
+    before.
+    """
+    plugin = models.OneToOneField(
+        CMSPlugin,
+        primary_key=True,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+
+    previous_bounds = models.JSONField(
+        default=dict,
+    )
+
+    requested = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+    )
+
+    class Meta:
+        db_table = 'cmsplugin_cascade_pending_sanitize'
+        verbose_name = _("Pending Sanitize")
+        verbose_name_plural = _("Pending Sanitizes")
+
+    def __str__(self):
+        return str(self.plugin_id)
+
+    @classmethod
+    def enqueue(cls, grid_root, previous_bounds):
+        """
+        Record that the descendants of the given container shall be sanitized, where
+        ``previous_bounds`` are the bounds of its grid before the edit. If the container is pending
+        already, only the moment of its request is updated.
+        """
+        previous_bounds = {str(pk): bounds for pk, bounds in previous_bounds.items()}
+        while True:
+            entry, created = cls.objects.get_or_create(plugin_id=grid_root.pk, defaults={
+                'previous_bounds': previous_bounds,
+            })
+            # retry, if the entry has been processed meanwhile
+            if created or cls.objects.filter(pk=entry.pk).update(requested=timezone.now()):
+                return
+
+    @classmethod
+    def process_pending(cls, limit=None):
+        """
+        Process the pending containers, the oldest request first, until none is left or ``limit``
+        of them have been processed. Entries locked by another worker are skipped. Return the
+        number of processed entries and a list of the primary keys of those which failed.
+        """
+        processed, failed = 0, []
+        while limit is None or processed < limit:
+            with transaction.atomic():
+                queryset = cls.objects.exclude(pk__in=failed).order_by('requested')
+                if connection.features.has_select_for_update_skip_locked:
+                    queryset = queryset.select_for_update(skip_locked=True)
+                entry = queryset.first()
+                if entry is None:
+                    break
+                try:
+                    with transaction.atomic():
+                        entry.process()
+                except Exception:
+                    logger.exception("Unable to sanitize the descendants of plugin {}".format(entry.pk))
+                    failed.append(entry.pk)
+                    continue
+            processed += 1
+        return processed, failed
+
+    def process(self):
+        """
+        Sanitize the descendants of the pending container and remove this entry, unless the
+        container has been edited again meanwhile.
+        """
+        plugin = CMSPlugin.objects.get(pk=self.plugin_id)
+        grid_root = CascadeAncestry.get_element(plugin.pk, plugin.plugin_type)
+        previous_bounds = {int(pk): tuple(bound and tuple(bound) for bound in bounds)
+                           for pk, bounds in self.previous_bounds.items()}
+        grid_root.sanitize_grid(previous_bounds)
+        placeholder, language = grid_root.placeholder, grid_root.language
+        if placeholder:
+            transaction.on_commit(lambda: placeholder.clear_cache(language))
+        PendingSanitize.objects.filter(pk=self.pk, requested=self.requested).delete()
+
+
 class PluginExtraFields(models.Model):
     """
     Store a set of allowed extra CSS classes and inline styles to be used for Cascade plugins
@@ -423,3 +723,5 @@ class CascadePage(PageExtension):
 
 extension_pool.register(CascadePage)
 models.signals.pre_delete.connect(CascadePage.delete_cascade_element, dispatch_uid='delete_cascade_element')
+models.signals.post_save.connect(CascadeAncestry.create_ancestry, dispatch_uid='create_cascade_ancestry')
+post_placeholder_operation.connect(CascadeAncestry.move_ancestry, dispatch_uid='move_cascade_ancestry')
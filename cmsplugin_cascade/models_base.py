@@ -1,11 +1,116 @@
+import copy
+from collections import defaultdict
+from contextvars import ContextVar
+from operator import attrgetter
+
 from django.db import models
+from django.db.models.base import DEFERRED
+from django.db.models.query import ModelIterable
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.html import mark_safe, format_html_join
 from django.utils.functional import cached_property
-import json
+from django.utils.module_loading import import_string
 
 from cms.models import CMSPlugin
 from cms.plugin_pool import plugin_pool
 from cms.utils.placeholder import get_placeholder_conf
+from treebeard.mp_tree import MP_NodeManager, MP_NodeQuerySet
+
+
+_glossary_decoder = None
+
+_building_instances = ContextVar('building_instances', default=False)
+
+
+def decode_glossary(value):
+    """
+    Decode a glossary using the function configured by ``CMSPLUGIN_CASCADE['glossary_decoder']``.
+    That function is resolved only once, since this is called for each glossary being accessed.
+    """
+    global _glossary_decoder
+
+    decoder = _glossary_decoder
+    if decoder is None:
+        from cmsplugin_cascade import app_settings
+
+        decoder = _glossary_decoder = import_string(app_settings.CMSPLUGIN_CASCADE['glossary_decoder'])
+    try:
+        glossary = decoder(value)
+        if isinstance(glossary, str):
+            # glossaries converted from former text fields may be encoded twice
+            glossary = decoder(glossary)
+    except ValueError:
+        return value
+    return glossary
+
+
+class RawGlossary:
+    """
+    A glossary as fetched from the database, which has not been decoded yet.
+    """
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+
+class LazyGlossaryAttribute(DeferredAttribute):
+    """
+    Decode the glossary on first access, rather than when the model instance is loaded.
+    """
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if value.__class__ is RawGlossary:
+            value = instance.__dict__[self.field.attname] = decode_glossary(value.value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class LazyJSONField(models.JSONField):
+    """
+    A JSONField keeping the value fetched from the database until its first access. This only
+    applies while building model instances, values fetched by ``values()`` or ``values_list()``
+    are decoded immediately.
+    """
+    descriptor_class = LazyGlossaryAttribute
+
+    def from_db_value(self, value, expression, connection):
+        if _building_instances.get() and isinstance(value, str) and getattr(expression, 'target', None) is self:
+            return RawGlossary(value)
+        return super().from_db_value(value, expression, connection)
+
+
+class LazyGlossaryIterable(ModelIterable):
+    """
+    Build model instances, keeping their glossaries as fetched from the database. No other code
+    runs, while a row is being converted and its model instance is built.
+    """
+    def __iter__(self):
+        iterator = super().__iter__()
+        while True:
+            token = _building_instances.set(True)
+            try:
+                instance = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _building_instances.reset(token)
+            yield instance
+
+
+class CascadeQuerySet(MP_NodeQuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = LazyGlossaryIterable
+
+
+class CascadeManager(MP_NodeManager):
+    def get_queryset(self):
+        return CascadeQuerySet(self.model).order_by('path')
 
 
 class CascadeModelBase(CMSPlugin):
@@ -22,7 +127,11 @@ class CascadeModelBase(CMSPlugin):
         parent_link=True,
     )
 
-    glossary = models.JSONField(blank=True, default=dict)
+    glossary = LazyJSONField(blank=True, default=dict)
+
+    objects = CascadeManager()
+
+    changed_glossary_keys = frozenset()
 
     def __str__(self):
         return self.plugin_class.get_identifier(self)
@@ -54,6 +163,22 @@ class CascadeModelBase(CMSPlugin):
         return ''
 
     def get_parent_instance(self):
+        if '_parent_instance_cache' in self.__dict__:
+            # set by load_placeholder_tree()
+            return self._parent_instance_cache
+        if self.parent_id is None:
+            return None
+        assigned_plugins = get_assigned_plugins(self)
+        if assigned_plugins is not None and self.parent_id in assigned_plugins:
+            # while rendering, django-CMS already fetched all plugins of our placeholder
+            parent = assigned_plugins[self.parent_id]
+            if not isinstance(parent, CascadeModelBase):
+                # in case our plugin is the child of a TextPlugin, use its grandparent
+                parent = assigned_plugins.get(parent.parent_id) if parent.plugin_type == 'TextPlugin' else None
+                if not isinstance(parent, CascadeModelBase):
+                    parent = None
+            self._parent_instance_cache = parent
+            return parent
         for model in CascadeModelBase._get_cascade_elements():
             try:
                 return model.objects.get(id=self.parent_id)
@@ -69,6 +194,22 @@ class CascadeModelBase(CMSPlugin):
                 except model.DoesNotExist:
                     continue
 
+    def get_ancestry(self):
+        """
+        Return the materialized ancestry of this element. Rebuild it, if it is missing or outdated.
+        """
+        from cmsplugin_cascade.models import CascadeAncestry
+
+        try:
+            ancestry = self.cascade_ancestry
+        except CascadeAncestry.DoesNotExist:
+            ancestry = None
+        if ancestry is None or ancestry.path != self.path:
+            ancestry = CascadeAncestry.rebuild(self)
+            if self.pk:
+                self.cascade_ancestry = ancestry
+        return ancestry
+
     def get_parent_glossary(self):
         """
         Return the glossary from the parent of this object. If there is no parent, retrieve
@@ -98,37 +239,98 @@ class CascadeModelBase(CMSPlugin):
         """
         return self.get_children().count()
 
-    def sanitize_children(self):
+    def sanitize_children(self, filter_child=None):
         """
-        Recursively walk down the plugin tree and invoke method ``save(sanitize_only=True)`` for
-        each child.
+        Recursively walk down the plugin tree and invoke method ``sanitize_model()`` for each child.
+        If ``filter_child`` is given, it is called for each child, and only if it returns True, that
+        child and its descendants are sanitized. All children whose glossary changed are written
+        using one ``bulk_update()`` per model, without sending signals.
         """
-        for model in CascadeModelBase._get_cascade_elements():
-            # execute query to not iterate over SELECT ... FROM while updating other models
-            children = list(model.objects.filter(parent_id=self.id))
-            for child in children:
-                child.save(sanitize_only=True)
-                child.sanitize_children()
+        load_placeholder_tree(self.placeholder, self.language, root=self)
+        bulk_update_glossaries(sanitize_plugins(self.child_plugin_instances, filter_child))
 
     @classmethod
     def from_db(cls, db, field_names, values):
-        instance = cls(*values)
-        if isinstance(instance.glossary, str):
-           instance.glossary = json.loads(instance.glossary)
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = loaded_values = {
+            attname: value for attname, value in zip(field_names, values) if value is not DEFERRED
+        }
+        if 'glossary' in loaded_values and loaded_values['glossary'].__class__ is not RawGlossary:
+            # the database backend already decoded the glossary
+            loaded_values['glossary'] = copy.deepcopy(loaded_values['glossary'])
         return instance
 
+    def get_own_glossary(self):
+        """
+        Return the glossary as it shall be stored in the database.
+        """
+        return self.glossary
+
+    def get_changed_glossary_keys(self):
+        """
+        Return the set of keys whose values in the glossary changed since this object was loaded
+        or saved. Glossaries which have not been accessed meanwhile, are not decoded.
+        """
+        if '_loaded_values' not in self.__dict__:
+            return set(self.get_own_glossary() or ())
+        loaded_glossary = self._loaded_values.get('glossary', DEFERRED)
+        if loaded_glossary is DEFERRED or self.__dict__.get('glossary') is loaded_glossary:
+            return set()
+        if loaded_glossary.__class__ is RawGlossary:
+            loaded_glossary = decode_glossary(loaded_glossary.value)
+        if not isinstance(loaded_glossary, dict):
+            loaded_glossary = {}
+        glossary = self.get_own_glossary() or {}
+        return {key for key in loaded_glossary.keys() | glossary.keys()
+                if loaded_glossary.get(key, DEFERRED) != glossary.get(key, DEFERRED)}
+
+    def get_changed_fields(self):
+        """
+        Return the set of attribute names of the fields which changed since this object was loaded
+        or saved, or None if this object has not been loaded from the database. This also applies
+        if its primary key has been replaced, as django-CMS does when copying plugins.
+        """
+        if self._state.adding or self.pk is None or '_loaded_values' not in self.__dict__:
+            return
+        pk_attnames = [f.attname for f in self._meta.concrete_fields if f.primary_key]
+        if any(self._loaded_values.get(attname, DEFERRED) != self.__dict__.get(attname) for attname in pk_attnames):
+            return
+        changed_fields = set()
+        for attname, value in self._loaded_values.items():
+            if attname == 'glossary':
+                if self.get_changed_glossary_keys():
+                    changed_fields.add(attname)
+            elif self.__dict__.get(attname, DEFERRED) != value:
+                changed_fields.add(attname)
+        return changed_fields
+
     def save(self, sanitize_only=False, *args, **kwargs):
         """
         A hook which let the plugin instance sanitize the current object model while saving it.
         With ``sanitize_only=True``, the current model object only is saved when the method
         ``sanitize_model()`` from the corresponding plugin actually changed the glossary.
+
+        Objects loaded from the database only write the fields which changed meanwhile. If nothing
+        changed, saving them is a no-op and no signals are sent. While saving, the keys changed in
+        the glossary are available to signal receivers as ``instance.changed_glossary_keys``.
         """
         sanitized = self.plugin_class.sanitize_model(self)
         if sanitize_only:
-            if sanitized:
-                super().save(no_signals=True)
-        else:
-            super().save(*args, **kwargs)
+            if not sanitized:
+                return
+            args, kwargs = (), {'no_signals': True}
+        if not args and 'update_fields' not in kwargs and not kwargs.get('force_insert'):
+            changed_fields = self.get_changed_fields()
+            if changed_fields is not None:
+                if not changed_fields:
+                    return
+                kwargs['update_fields'] = changed_fields | {'changed_date'}
+        self.changed_glossary_keys = frozenset(self.get_changed_glossary_keys())
+        super().save(*args, **kwargs)
+        self._loaded_values = {f.attname: self.__dict__[f.attname] for f in self._meta.concrete_fields
+                               if f.attname in self.__dict__}
+        if 'glossary' in self._loaded_values and self._loaded_values['glossary'].__class__ is not RawGlossary:
+            self._loaded_values['glossary'] = copy.deepcopy(self._loaded_values.get('glossary'))
 
     @classmethod
     def _get_cascade_elements(cls):
@@ -143,3 +345,125 @@ class CascadeModelBase(CMSPlugin):
                        if issubclass(p.model, cls)])
             cls._cached_cascade_elements = cce
         return cls._cached_cascade_elements
+
+
+def get_assigned_plugins(plugin):
+    """
+    Return a dict mapping primary keys onto the plugins of the placeholder the given plugin belongs
+    to, as downcasted by django-CMS when rendering that placeholder, or None if it hasn't done so.
+    """
+    if not CMSPlugin.placeholder.is_cached(plugin):
+        return
+    placeholder = plugin.placeholder
+    all_plugins = getattr(placeholder, '_all_plugins_cache', None)
+    if all_plugins is None:
+        return
+    index = placeholder.__dict__.get('_cascade_plugins_index')
+    if index is None or index[0] is not all_plugins:
+        index = placeholder._cascade_plugins_index = all_plugins, {p.pk: p for p in all_plugins}
+    return index[1]
+
+
+def load_placeholder_tree(placeholder, language=None, root=None):
+    """
+    Load all plugins of the given placeholder, using one query for the tree and one for each concrete
+    model, and return the list of root plugins. As with ``cms.utils.plugins.build_plugin_tree``,
+    the children of each plugin are available as ``child_plugin_instances``. Inline elements and
+    shared glossaries of Cascade elements are prefetched.
+
+    For each Cascade element, its parent instance is resolved, so that ``get_parent_instance()``
+    and ``get_complete_glossary()`` won't hit the database anymore. Complete glossaries are merged
+    top-down on first access, hence glossaries never accessed are not even decoded.
+    If a plugin instance is given as ``root``, only its descendants are loaded and attached to it.
+    """
+    plugin_qs = CMSPlugin.objects.filter(placeholder=placeholder)
+    if language:
+        plugin_qs = plugin_qs.filter(language=language)
+    if root:
+        plugin_qs = plugin_qs.filter(path__startswith=root.path, depth__gt=root.depth)
+    plugins = list(plugin_qs.order_by('path'))
+
+    # downcast the plugins using one query for each concrete model
+    plugin_types = defaultdict(list)
+    for plugin in plugins:
+        try:
+            model = plugin_pool.get_plugin(plugin.plugin_type).model
+        except KeyError:
+            continue
+        plugin_types[model._meta.concrete_model].append((plugin.pk, model))
+    instances = {}
+    for concrete_model, entries in plugin_types.items():
+        queryset = concrete_model._default_manager.filter(pk__in=[pk for pk, _ in entries])
+        if issubclass(concrete_model, CascadeModelBase):
+            field_names = [f.name for f in concrete_model._meta.get_fields()]
+            if 'shared_glossary' in field_names:
+                queryset = queryset.select_related('shared_glossary')
+            queryset = queryset.prefetch_related(*[name for name in ('inline_elements', 'sortinline_elements')
+                                                   if name in field_names])
+        models_by_pk = dict(entries)
+        for instance in queryset:
+            # proxy models share the rows of their concrete model
+            instance.__class__ = models_by_pk[instance.pk]
+            instance.placeholder = placeholder
+            instances[instance.pk] = instance
+
+    # wire up the tree, parents are ordered before their children
+    nodes = {root.pk: root} if root else {}
+    children = defaultdict(list)
+    for plugin in plugins:
+        node = nodes[plugin.pk] = instances.get(plugin.pk, plugin)
+        children[node.parent_id].append(node)
+    for node in nodes.values():
+        node.child_plugin_instances = sorted(children[node.pk], key=attrgetter('position'))
+
+    # resolve the parent instances, so that complete glossaries are resolved top-down on access
+    for plugin in plugins:
+        node = nodes[plugin.pk]
+        if not isinstance(node, CascadeModelBase):
+            continue
+        parent = nodes.get(node.parent_id)
+        if parent is not None and not isinstance(parent, CascadeModelBase):
+            # in case our plugin is the child of a TextPlugin, use its grandparent
+            parent = nodes.get(parent.parent_id) if parent.plugin_type == 'TextPlugin' else None
+            if not isinstance(parent, CascadeModelBase):
+                parent = None
+        node._parent_instance_cache = parent
+    return sorted(children[root.pk if root else None], key=attrgetter('position'))
+
+
+def sanitize_plugins(plugins, filter_plugin=None):
+    """
+    Recursively walk down the given plugins, as loaded by ``load_placeholder_tree()``, and invoke
+    method ``sanitize_model()`` for each Cascade element. If ``filter_plugin`` is given, it is called
+    for each element, and only if it returns True, that element and its descendants are sanitized.
+    Return the list of elements whose glossary changed, without saving them.
+    """
+    changed_plugins = []
+
+    def sanitize(plugins):
+        for plugin in plugins:
+            if not isinstance(plugin, CascadeModelBase) or filter_plugin and not filter_plugin(plugin):
+                continue
+            # the parent may just have been sanitized, hence resolve the glossary again
+            plugin._complete_glossary_cache = dict(plugin.get_parent_glossary(), **(plugin.glossary or {}))
+            plugin.plugin_class.sanitize_model(plugin)
+            if plugin.get_changed_glossary_keys():
+                changed_plugins.append(plugin)
+            plugin._complete_glossary_cache = dict(plugin.get_parent_glossary(), **(plugin.glossary or {}))
+            sanitize(plugin.child_plugin_instances)
+
+    sanitize(plugins)
+    return changed_plugins
+
+
+def bulk_update_glossaries(plugins, batch_size=None):
+    """
+    Write the glossaries of the given Cascade elements using one ``bulk_update()`` per concrete
+    model, without sending signals.
+    """
+    changed_elements = defaultdict(list)
+    for plugin in plugins:
+        model = plugin._meta.concrete_model
+        changed_elements[model].append(model(pk=plugin.pk, glossary=plugin.get_own_glossary()))
+    for model, elements in changed_elements.items():
+        model.objects.bulk_update(elements, ['glossary'], batch_size=batch_size)
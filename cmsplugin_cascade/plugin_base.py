@@ -147,15 +147,24 @@ class TransparentWrapper:
     def get_child_classes(cls, slot, page, instance=None):
         if hasattr(cls, 'direct_child_classes'):
             return cls.direct_child_classes
+        from cms.plugin_pool import plugin_pool
+
         child_classes = set(super().get_child_classes(slot, page, instance))
-        while True:
-            instance = instance.get_parent_instance() if instance and instance.parent else None
-            if instance is None:
-                child_classes.update(super().get_child_classes(slot, page, instance))
-                return list(child_classes)
-            if not issubclass(instance.plugin_class, TransparentWrapper):
-                child_classes.update(instance.plugin_class.get_child_classes(slot, page, instance))
-                return list(child_classes)
+        if isinstance(instance, CascadeModelBase) and instance.parent_id:
+            # skip transparent ancestors without fetching them
+            ancestry = instance.get_ancestry()
+            for pk, plugin_type in reversed(ancestry.ancestors):
+                if plugin_type == 'TextPlugin':
+                    continue
+                plugin_class = plugin_pool.get_plugin(plugin_type)
+                if not issubclass(plugin_class.model, CascadeModelBase):
+                    break
+                if not issubclass(plugin_class, TransparentWrapper):
+                    instance = ancestry.get_element(pk, plugin_type)
+                    child_classes.update(plugin_class.get_child_classes(slot, page, instance))
+                    return list(child_classes)
+        child_classes.update(super().get_child_classes(slot, page, None))
+        return list(child_classes)
 
     @classmethod
     def get_parent_classes(cls, slot, page, instance=None):
@@ -163,7 +172,7 @@ class TransparentWrapper:
             return cls.direct_parent_classes
         parent_classes = set(super().get_parent_classes(slot, page, instance) or [])
         if isinstance(instance, CascadeElement):
-            instance = instance.get_parent_instance() if instance and instance.parent else None
+            instance = instance.get_parent_instance() if instance and instance.parent_id else None
             if instance is not None:
                 parent_classes.add(instance.plugin_type)
         return list(parent_classes)
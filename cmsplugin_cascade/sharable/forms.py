@@ -168,6 +168,10 @@ class SharableGlossaryMixin(metaclass=forms.MediaDefiningClass):
             obj.shared_glossary = shared_glossary
             obj.save()
 
+    @classmethod
+    def get_render_queryset(cls):
+        return super().get_render_queryset().select_related('shared_glossary')
+
     @classmethod
     def get_data_representation(cls, instance):
         data = super().get_data_representation(instance)
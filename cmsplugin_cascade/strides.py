@@ -1,39 +1,153 @@
+import copy
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
 from django.core.cache import caches
-from django.template.context import make_context
+from django.db import connections
+from django.template.context import BaseContext, make_context
 from django.template.exceptions import TemplateDoesNotExist
 from django.template.loader import get_template
 from django.utils.html import format_html_join
 from django.utils.safestring import mark_safe
+from django.utils import translation
 from django.utils.translation import get_language_from_request
 
 from classytags.utils import flatten_context
 from djangocms_text_ckeditor.utils import OBJ_ADMIN_RE
+from sekizai.data import UniqueSequence
 
 from cmsplugin_cascade import app_settings
+from cmsplugin_cascade.fragments import StaleFragment, call_cache, get_fragment_store
 from cmsplugin_cascade.mixins import CascadePluginMixin
+from cmsplugin_cascade.utils import get_subtree_digest
 
-__all__ = ['register_stride', 'StrideContentRenderer']
+__all__ = ['register_stride', 'stride_trees', 'invalidate_stride', 'StrideContentRenderer']
+
+
+class StrideInlineElement:
+    """
+    Emulate an InlineCascadeElement or SortableInlineCascadeElement.
+    """
+    __slots__ = ('id', 'glossary')
+
+    def __init__(self, id, glossary):
+        self.id = id
+        self.glossary = glossary
 
 
 class EmulateQuerySet:
+    __slots__ = ('elements',)
+
     def __init__(self, elements):
-        self.elements = elements
+        self.elements = tuple(StrideInlineElement(id, glossary) for id, glossary in enumerate(elements, 1))
 
     def all(self):
-        for id, glossary in enumerate(self.elements, 1):
-            yield type(str('StrideInlineElement'), (object,), {'id': id, 'glossary': glossary})()
+        return iter(self.elements)
 
+    def count(self):
+        return len(self.elements)
 
-class StrideElementBase:
+
+class StrideNode:
     """
-    Emulate a CascadeElement to be used by the CascadeContentRenderer instead of the CMSContentRenderer.
+    A node of a parsed stride tree. Nodes are built once per tree and shared among all requests
+    rendering that tree. Therefore they must be treated as immutable. Everything depending on the
+    current rendering is kept in the element objects wrapping a node.
+    Each node carries the Merkle hash of its subtree in ``digest``. Since plugins also render data
+    inherited from their ancestors, ``fragment_digest`` additionally covers the content of all
+    ancestors (but not their other children) together with the node's primary key, and is used to
+    build the fragment's cache key.
     """
-    def __init__(self, plugin, data, children_data, parent=None):
+    __slots__ = ('plugin', 'element_class', 'pk', 'data', 'glossary', 'inline_elements', 'children', 'parent',
+                 'previous_sibling', 'next_sibling', 'digest', 'fragment_digest', 'body_segments')
+
+    def __init__(self, plugin, element_class, data, parent=None):
         self.plugin = plugin
-        self.id = data.get('pk')
+        self.element_class = element_class
+        self.pk = data.get('pk')
+        self.data = data
         self.glossary = data.get('glossary', {})
-        self.sortinline_elements = self.inline_elements = EmulateQuerySet(data.get('inlines', []))
-        self.children_data = children_data
+        self.inline_elements = EmulateQuerySet(data.get('inlines', ()))
+        self.children = ()
+        self.parent = parent
+        self.previous_sibling = self.next_sibling = None
+        self.digest = self.fragment_digest = None
+        self.body_segments = None
+
+    @classmethod
+    def build(cls, plugins, parent=None, plugin_instances=None, ancestors_digest=''):
+        """
+        Build a tuple of nodes from a list of serialized plugins ``(plugin_type, data, children_data)``.
+        Plugins without a stride counterpart are skipped.
+        """
+        if plugin_instances is None:
+            plugin_instances = {}
+        nodes = []
+        for plugin_type, data, children_data in plugins:
+            element_class = strides_element_map.get(plugin_type)
+            if element_class is None:
+                continue
+            if plugin_type not in plugin_instances:
+                plugin_instances[plugin_type] = strides_plugin_map[plugin_type]()
+            plugin = plugin_instances[plugin_type]
+            node = cls(plugin, element_class, data, parent)
+            render_template = getattr(plugin, 'render_template', None)
+            own_digest = get_subtree_digest(plugin_type, data, render_template)
+            node.children = cls.build(children_data, node, plugin_instances, cls._hash(ancestors_digest, own_digest))
+            if hasattr(element_class, 'tokenize_body'):
+                node.body_segments = element_class.tokenize_body(node)
+            node.digest = get_subtree_digest(plugin_type, data, render_template, (c.digest for c in node.children))
+            # templates may render the primary key, for instance as HTML id
+            node.fragment_digest = cls._hash(ancestors_digest, node.digest, str(node.pk))
+            nodes.append(node)
+        cls.link_siblings(nodes)
+        return tuple(nodes)
+
+    @staticmethod
+    def link_siblings(nodes):
+        for previous_node, node in zip(nodes, nodes[1:]):
+            previous_node.next_sibling = node
+            node.previous_sibling = previous_node
+
+    @staticmethod
+    def _hash(*digests):
+        return hashlib.sha1(':'.join(digests).encode('utf-8')).hexdigest()
+
+    def get_fragment_digests(self):
+        """
+        Yield the fragment digests of this node and of all its descendants caching their fragments.
+        """
+        if getattr(self.plugin, 'cache', True):
+            yield self.fragment_digest
+        for child in self.children:
+            yield from child.get_fragment_digests()
+
+    def create_element(self, parent=None):
+        return self.element_class(self, parent=parent)
+
+
+class StrideElementBase:
+    """
+    Emulate a CascadeElement to be used by the CascadeContentRenderer instead of the CMSContentRenderer.
+    Each element wraps a shared ``StrideNode`` and keeps the state of the current rendering.
+    """
+    def __init__(self, node, parent=None):
+        self.node = node
+        self.plugin = node.plugin
+        self.id = node.pk
+        # stride nodes are shared, hence never let a plugin modify their glossary
+        self.glossary = dict(node.glossary)
+        self.sortinline_elements = self.inline_elements = node.inline_elements
         self.parent = parent
 
     @property
@@ -45,14 +159,11 @@ class StrideElementBase:
         return self.plugin.__class__
 
     def child_plugin_instances(self):
-        for plugin_type, data, children_data in self.children_data:
-            plugin_class = strides_plugin_map.get(plugin_type)
-            element_class = strides_element_map.get(plugin_type)
-            if element_class:
-                yield element_class(plugin_class(), data, children_data, parent=self)
+        for node in self.node.children:
+            yield node.create_element(parent=self)
 
     def get_num_children(self):
-        return len(self.children_data)
+        return len(self.node.children)
 
     def get_complete_glossary(self):
         if not hasattr(self, '_complete_glossary_cache'):
@@ -92,31 +203,56 @@ class StrideElementBase:
 
 
 class TextStrideElement:
-    def __init__(self, plugin, data, children_data, parent=None):
-        self.plugin = plugin
-        self.pk = data.get('pk')
-        self.body = data.get('body')
-        self.children_data = children_data
+    """
+    Emulate a Text plugin. Its body is split into literal segments and the child plugins they
+    enclose only once, when its node is built.
+    """
+    __slots__ = ('node', 'plugin', 'pk', 'body', 'parent')
+
+    def __init__(self, node, parent=None):
+        self.node = node
+        self.plugin = node.plugin
+        self.pk = node.pk
+        self.body = node.data.get('body')
         self.parent = parent
 
+    def get_complete_glossary(self):
+        if self.parent:
+            return self.parent.get_complete_glossary()
+        return {}
+
+    @staticmethod
+    def tokenize_body(node):
+        """
+        Return a tuple of literal segments and a tuple of the child nodes to be rendered between
+        each pair of them.
+        """
+        body = node.data.get('body') or ''
+        children_nodes = {child.pk: child for child in node.children if child.pk is not None}
+        literals, slots, literal, position = [], [], '', 0
+        for match in OBJ_ADMIN_RE.finditer(body):
+            literal += body[position:match.start()]
+            position = match.end()
+            child_node = children_nodes.get(int(match.group('pk')))
+            if child_node is None:
+                continue  # the referenced plugin does not exist or has no stride counterpart
+            literals.append(literal)
+            slots.append(child_node)
+            literal = ''
+        literals.append(literal + body[position:])
+        return tuple(literals), tuple(slots)
+
     def tags_to_user_html(self, context, placeholder):
         content_renderer = context['cms_content_renderer']
-        children_instances = {}
-        for plugin_type, data, children_data in self.children_data:
-            plugin_class = strides_plugin_map.get(plugin_type)
-            element_class = strides_element_map.get(plugin_type)
-            if element_class and 'pk' in data:
-                sub_plugin = plugin_class()
-                children_instances[data['pk']] = element_class(sub_plugin, data, children_data, parent=self)
-
-        def _render_tag(m):
-            plugin_id = int(m.groupdict()['pk'])
-            instance = children_instances[plugin_id]
+        literals, slots = self.node.body_segments
+        contents = [literals[0]]
+        for child_node, literal in zip(slots, literals[1:]):
+            instance = child_node.create_element(parent=self)
             with context.push():
                 sub_context = instance.plugin.render(context, instance, placeholder)
-                return content_renderer.render_plugin(instance, sub_context)
-
-        return OBJ_ADMIN_RE.sub(_render_tag, self.body)
+                contents.append(content_renderer.render_plugin(instance, sub_context))
+            contents.append(literal)
+        return ''.join(contents)
 
 
 class StridePluginBase(CascadePluginMixin):
@@ -157,18 +293,12 @@ class StridePluginBase(CascadePluginMixin):
         return False
 
     def get_previous_instance(self, obj):
-        if obj and obj.parent:
-            for pos, sibling in enumerate(obj.parent.children_data):
-                if sibling[1].get('pk') == obj.pk and pos > 0:
-                    prev_pt, prev_data, prev_cd = obj.parent.children_data[pos - 1]
-                    return strides_plugin_map[prev_pt]()
+        if obj and obj.node.previous_sibling:
+            return obj.node.previous_sibling.create_element(parent=obj.parent)
 
     def get_next_instance(self, obj):
-        if obj and obj.parent:
-            for pos, sibling in enumerate(obj.parent.children_data):
-                if sibling[1].get('pk') == obj.pk and pos < len(obj.parent.children_data):
-                    next_pt, next_data, next_cd = obj.parent.children_data[pos + 1]
-                    return strides_plugin_map[next_pt]()
+        if obj and obj.node.next_sibling:
+            return obj.node.next_sibling.create_element(parent=obj.parent)
 
 
 class TextStridePlugin(StridePluginBase):
@@ -181,52 +311,504 @@ class TextStridePlugin(StridePluginBase):
         return context
 
 
+class StrideTreeCache:
+    """
+    Process wide cache for parsed stride files. Each file is parsed only once and kept as a tree
+    of nested tuples ``(plugin_type, data, children_data)`` together with its ``StrideNode``-s
+    inside a bounded LRU, keyed by its resolved path. Files compiled into the binary format are
+    memory mapped instead. The file's modification time and size are checked on each lookup, so
+    that editing a stride file invalidates its cached tree.
+    If ``CMSPLUGIN_CASCADE['stride_trees_shared_cache']`` is set, parsed trees additionally are
+    published to Django's default cache, so that other processes can skip parsing them.
+    """
+    def __init__(self):
+        self._resolved_paths = {}
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_tree(self, datafile):
+        path, signature = self._resolve(datafile)
+        with self._lock:
+            try:
+                cached_signature, tree_data = self._trees[path]
+            except KeyError:
+                pass
+            else:
+                if cached_signature == signature:
+                    self._trees.move_to_end(path)
+                    return tree_data
+        tree_data = self._load(datafile, path, signature)
+        with self._lock:
+            self._trees[path] = signature, tree_data
+            self._trees.move_to_end(path)
+            while len(self._trees) > app_settings.CMSPLUGIN_CASCADE['stride_trees_maxsize']:
+                self._trees.popitem(last=False)
+        return tree_data
+
+    def clear(self):
+        with self._lock:
+            self._resolved_paths.clear()
+            self._trees.clear()
+
+    def _resolve(self, datafile):
+        """
+        Return the absolute path of the given stride file together with its signature. Files not
+        given as absolute path are looked up by the static files finders.
+        """
+        path = self._resolved_paths.get(datafile)
+        if path:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                pass  # file has been removed since it was resolved
+            else:
+                return path, (stat.st_mtime_ns, stat.st_size)
+        path = datafile if os.path.isabs(datafile) and os.path.isfile(datafile) else finders.find(datafile)
+        if not path:
+            raise IOError("Unable to find file: {}".format(datafile))
+        stat = os.stat(path)
+        self._resolved_paths[datafile] = path
+        return path, (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, datafile, path, signature):
+        from cmsplugin_cascade.binary_strides import is_binary_stride, load_binary_stride
+
+        if is_binary_stride(path):
+            # memory mapped, hence shared among processes by the page cache
+            return {'datafile': datafile, 'nodes': load_binary_stride(path)}
+        if app_settings.CMSPLUGIN_CASCADE['stride_trees_shared_cache']:
+            cache = caches['default']
+            key = 'cascade-strides:{}:{}:{}'.format(datafile, *signature)
+            tree_data = cache.get(key)
+            if tree_data is None:
+                tree_data = self._parse(path)
+                cache.set(key, tree_data)
+        else:
+            tree_data = self._parse(path)
+        # nodes refer to plugin instances and hence are never published to the shared cache
+        return dict(tree_data, datafile=datafile, nodes=StrideNode.build(tree_data['plugins']))
+
+    @classmethod
+    def _parse(cls, path):
+        with io.open(path) as fp:
+            tree_data = json.load(fp)
+        return dict(tree_data, plugins=cls._freeze(tree_data.get('plugins', [])))
+
+    @classmethod
+    def _freeze(cls, plugins):
+        return tuple((plugin_type, data, cls._freeze(children_data)) for plugin_type, data, children_data in plugins)
+
+
+stride_trees = StrideTreeCache()
+
+
+def _get_generation_key(datafile):
+    return 'cascade_generation:{}'.format(hashlib.md5(str(datafile).encode('utf-8')).hexdigest())
+
+
+def get_stride_generation(datafile):
+    """
+    Return the current generation of the cached fragments belonging to the given stride file.
+    """
+    cache = caches['default']
+    key = _get_generation_key(datafile)
+    generation = cache.get(key)
+    if generation is None:
+        # start with a timestamp, so that an evicted counter never resurrects fragments of older generations
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_stride_generation(datafile):
+    """
+    Asynchronous variant of ``get_stride_generation()``.
+    """
+    key = _get_generation_key(datafile)
+    generation = await call_cache('get', key)
+    if generation is None:
+        await call_cache('add', key, time.time_ns(), timeout=None)
+        generation = await call_cache('get', key)
+    return generation
+
+
+def invalidate_stride(datafile):
+    """
+    Invalidate all cached fragments of the given stride file, without having to clear the whole cache.
+    """
+    cache = caches['default']
+    key = _get_generation_key(datafile)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+_render_executor = None
+_render_executor_lock = threading.Lock()
+_render_thread_state = threading.local()
+
+
+def _get_render_executor():
+    global _render_executor
+
+    with _render_executor_lock:
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(
+                max_workers=app_settings.CMSPLUGIN_CASCADE['stride_render_threads'],
+                thread_name_prefix='cascade-stride',
+            )
+        return _render_executor
+
+
 class StrideContentRenderer:
+    """
+    Render a tree of stride elements. If ``CMSPLUGIN_CASCADE['cache_strides']`` is set, the rendered
+    fragments of all nodes are fetched from the fragment store using a single round-trip before rendering,
+    and newly rendered fragments are written back using a single round-trip afterwards. Each cached
+    fragment contains its HTML together with the content it added to the Sekizai blocks.
+    Fragment keys are namespaced by site, language, template set and stride file, and contain the
+    generation of that stride file, so that it can be invalidated using ``invalidate_stride()``.
+    If ``CMSPLUGIN_CASCADE['stride_render_threads']`` is set, top-level plugins missing in the cache
+    are rendered concurrently on a thread pool of that size.
+    """
     def __init__(self, request):
         self.request = request
         self.language = get_language_from_request(request)
+        self.datafile = None
+        self._fragment_key_prefix = None
         self._cached_templates = {}
+        self._fragments = {}
+        self._pending_fragments = {}
+        self._render_durations = {}
+        self._locks = {}
 
     def render_cascade(self, context, tree_data):
-        contents = []
-        # create temporary copy of context to prevent pollution for other CMS placeholders
+        # render on a layer of its own, which is removed afterwards to prevent pollution for other CMS placeholders
+        if not isinstance(context, BaseContext):
+            context = make_context(context)
+        depth = len(context.dicts)
+        context.push()
+        try:
+            return mark_safe(''.join(self._iter_cascade(context, tree_data)))
+        finally:
+            while len(context.dicts) > depth:
+                context.pop()
+
+    def stream_cascade(self, context, tree_data, sekizai_blocks=()):
+        """
+        Generator yielding the HTML of each top-level plugin of the stride tree, as soon as it has
+        been rendered. It can be passed to a ``StreamingHttpResponse``.
+        The page template rendering ``{% render_block %}`` usually has been sent already, when the
+        plugins add their content to the Sekizai blocks. Therefore the content of the Sekizai blocks
+        named in ``sekizai_blocks``, such as ``('css', 'js')``, is yielded after the last plugin.
+        """
+        from sekizai.helpers import get_varname as get_sekizai_context_key
+
+        sekizai_context_key = get_sekizai_context_key()
         context = make_context(flatten_context(context))
-        for plugin_type, data, children_data in tree_data.get('plugins', []):
-            plugin_class = strides_plugin_map.get(plugin_type)
-            element_class = strides_element_map.get(plugin_type)
-            plugin_instance = element_class(plugin_class(), data, children_data)
-            # create a temporary object to store the plugins cache status
-            cms_cachable_plugins = type(str('CachablePlugins'), (object,), {'value': True})
-            context.push(cms_cachable_plugins=cms_cachable_plugins)
-            contents.append(self.render_plugin(plugin_instance, context))
+        if context.get(sekizai_context_key) is None:
+            context[sekizai_context_key] = defaultdict(UniqueSequence)
+        yield from self._iter_cascade(context, tree_data)
+        for name in sekizai_blocks:
+            content = '\n'.join(context[sekizai_context_key][name])
+            if content:
+                yield mark_safe(content)
+
+    async def arender_cascade(self, context, tree_data):
+        """
+        Asynchronous variant of ``render_cascade()`` to be used in ASGI deployments. Cached fragments
+        are fetched using Django's asynchronous cache API, so that a fully cached stride is rendered
+        without leaving the event loop. Only top-level plugins missing in the cache are handed off to
+        a thread for rendering.
+        """
+        if not isinstance(context, BaseContext):
+            context = make_context(context)
+        nodes = self._get_nodes(tree_data)
+        depth = len(context.dicts)
+        context.push(cms_content_renderer=self)
+        contents = []
+        try:
+            await self.aprefetch_fragments(nodes)
+            sekizai_blocks = context.get(self._get_sekizai_context_key())
+            for node in nodes:
+                fragment = self._get_prefetched_fragment(node)
+                if fragment is None:
+                    contents.append(await sync_to_async(self._render_node)(node, context))
+                else:
+                    self._extend_sekizai_blocks(sekizai_blocks, fragment[1])
+                    contents.append(fragment[0])
+        finally:
+            while len(context.dicts) > depth:
+                context.pop()
+            store = get_fragment_store()
+            pending_fragments, self._pending_fragments = self._pending_fragments, {}
+            render_durations, self._render_durations = self._render_durations, {}
+            locks, self._locks = self._locks, {}
+            try:
+                if pending_fragments:
+                    await store.aset_many(pending_fragments, render_durations)
+            finally:
+                await store.arelease(locks)
         return mark_safe(''.join(contents))
 
+    def _get_nodes(self, tree_data):
+        nodes = tree_data.get('nodes')
+        if nodes is None:
+            nodes = StrideNode.build(tree_data.get('plugins', []))
+        if tree_data.get('datafile') != self.datafile:
+            self.datafile = tree_data.get('datafile')
+            self._fragment_key_prefix = None
+        return nodes
+
+    def _iter_cascade(self, context, tree_data):
+        nodes = self._get_nodes(tree_data)
+        context['cms_content_renderer'] = self
+        self.prefetch_fragments(nodes)
+        futures = {}
+        try:
+            futures = self.submit_subtrees(context, nodes)
+            for node in nodes:
+                if node in futures:
+                    renderer, future = futures.pop(node)
+                    try:
+                        content, sekizai_blocks = future.result()
+                    finally:
+                        self._merge_renderer(renderer)
+                    self._extend_sekizai_blocks(context.get(self._get_sekizai_context_key()), sekizai_blocks)
+                    yield content
+                else:
+                    yield self._render_node(node, context)
+        finally:
+            # wait for subtrees not consumed, so that their fragments are stored and their locks released
+            for renderer, future in futures.values():
+                future.exception()
+                self._merge_renderer(renderer)
+            self.flush_fragments()
+
+    def _render_node(self, node, context):
+        plugin_instance = node.create_element()
+        # create a temporary object to store the plugins cache status
+        cms_cachable_plugins = type(str('CachablePlugins'), (object,), {'value': True})
+        context.push(cms_cachable_plugins=cms_cachable_plugins)
+        return self.render_plugin(plugin_instance, context)
+
+    def submit_subtrees(self, context, nodes):
+        """
+        Submit the top-level nodes missing in the cache to the thread pool for rendering. Return a
+        dictionary mapping those nodes to the renderer used on the thread pool and its future.
+        """
+        max_workers = app_settings.CMSPLUGIN_CASCADE['stride_render_threads']
+        if not max_workers or getattr(_render_thread_state, 'active', False):
+            # disabled, or nested inside a subtree which itself is rendered on the thread pool
+            return {}
+        missed_nodes = [node for node in nodes if self._get_prefetched_fragment(node) is None]
+        if len(missed_nodes) < 2:
+            return {}
+        executor = _get_render_executor()
+        flat_context = flatten_context(context)
+        language = translation.get_language()
+        futures = {}
+        for node in missed_nodes:
+            renderer = self._fork_renderer()
+            futures[node] = renderer, executor.submit(renderer._render_subtree, node, flat_context, language)
+        return futures
+
+    def _fork_renderer(self):
+        """
+        Return a copy of this renderer for rendering on another thread. It shares no mutable state
+        with this renderer, hence after rendering, its state must be merged back using
+        ``_merge_renderer()`` on the submitting thread.
+        """
+        if self._fragment_key_prefix is None and app_settings.CMSPLUGIN_CASCADE['cache_strides']:
+            self._fragment_key_prefix = self.get_fragment_key_prefix()
+        renderer = copy.copy(self)
+        renderer._cached_templates = dict(self._cached_templates)
+        renderer._fragments = dict(self._fragments)
+        renderer._pending_fragments, renderer._render_durations, renderer._locks = {}, {}, {}
+        return renderer
+
+    def _merge_renderer(self, renderer):
+        self._cached_templates.update(renderer._cached_templates)
+        self._fragments.update(renderer._fragments)
+        self._pending_fragments.update(renderer._pending_fragments)
+        self._render_durations.update(renderer._render_durations)
+        self._locks.update(renderer._locks)
+
+    def _render_subtree(self, node, flat_context, language):
+        """
+        Render a top-level node using its own context and Sekizai blocks, so that it can run on
+        another thread. The Sekizai blocks are merged into the page in document order afterwards.
+        """
+        sekizai_blocks = defaultdict(UniqueSequence)
+        context = make_context(flat_context)
+        context[self._get_sekizai_context_key()] = sekizai_blocks
+        context['cms_content_renderer'] = self
+        cms_cachable_plugins = type(str('CachablePlugins'), (object,), {'value': True})
+        context.push(cms_cachable_plugins=cms_cachable_plugins)
+        _render_thread_state.active = True
+        try:
+            with translation.override(language):
+                content = self.render_plugin(node.create_element(), context)
+        finally:
+            _render_thread_state.active = False
+            # plugins may have queried the database, whose connections are kept per thread
+            connections.close_all()
+        return content, sekizai_blocks
+
+    @staticmethod
+    def _get_sekizai_context_key():
+        from sekizai.helpers import get_varname as get_sekizai_context_key
+
+        return get_sekizai_context_key()
+
     def render_plugin(self, instance, context, placeholder=None, editable=False):
         from sekizai.helpers import get_varname as get_sekizai_context_key
 
         sekizai_context_key = get_sekizai_context_key()
-        if app_settings.CMSPLUGIN_CASCADE['cache_strides'] and getattr(instance.plugin, 'cache', not editable):
-            cache = caches['default']
-            key = 'cascade_element-{}'.format(instance.pk)
-            content = cache.get(key)
-            if content:
-                context[sekizai_context_key]['css'].extend(cache.get(key + ':css_list', []))
-                context[sekizai_context_key]['js'].extend(cache.get(key + ':js_list', []))
+        outer_sekizai_blocks = context.get(sekizai_context_key)
+        cachable = app_settings.CMSPLUGIN_CASCADE['cache_strides'] and getattr(instance.plugin, 'cache', not editable)
+        if cachable:
+            key = self.get_fragment_key(instance)
+            fragment = self.claim_fragment(key)
+            if fragment is not None:
+                content, sekizai_blocks = fragment
+                self._extend_sekizai_blocks(outer_sekizai_blocks, sekizai_blocks)
                 return content
+            # collect the content added to the Sekizai blocks separately, so that it can be cached
+            sekizai_blocks = defaultdict(UniqueSequence)
         else:
             context['cms_cachable_plugins'].value = False
-        context = instance.plugin.render(context, instance, placeholder)
-        context = flatten_context(context)
-
-        template = instance.plugin._get_render_template(context, instance, placeholder)
-        template = self.get_cached_template(template)
-        content = template.render(context)
-        if context['cms_cachable_plugins'].value:
-            cache.set(key, content)
-            cache.set(key + ':css_list', context[sekizai_context_key]['css'].data)
-            cache.set(key + ':js_list', context[sekizai_context_key]['js'].data)
+
+        # render from the layered context, rather than copying all its variables into a flat dict
+        start = time.monotonic()
+        depth = len(context.dicts)
+        if cachable:
+            context.push({sekizai_context_key: sekizai_blocks})
+        try:
+            plugin_context = instance.plugin.render(context, instance, placeholder)
+            if not isinstance(plugin_context, BaseContext):
+                plugin_context = make_context(plugin_context)
+            template = instance.plugin._get_render_template(plugin_context, instance, placeholder)
+            template = self.get_cached_template(template)
+            content = getattr(template, 'template', template).render(plugin_context)
+            cms_cachable_plugins = plugin_context.get('cms_cachable_plugins')
+        finally:
+            # also remove the layers some plugins leave on the context stack
+            while len(context.dicts) > depth:
+                context.pop()
+
+        if cachable:
+            self._extend_sekizai_blocks(outer_sekizai_blocks, sekizai_blocks)
+            if cms_cachable_plugins is None or cms_cachable_plugins.value:
+                fragment = content, {name: list(data) for name, data in sekizai_blocks.items() if data}
+                self._fragments[key] = self._pending_fragments[key] = fragment
+                self._render_durations[key] = time.monotonic() - start
         return content
 
+    def get_fragment_key(self, instance):
+        """
+        Return the cache key for the rendered fragment of a stride element or node. Since it is
+        derived from the content of the subtree and its ancestors, rather than the primary key,
+        unchanged subtrees keep their cached fragments after editing other parts of a stride file.
+        """
+        if self._fragment_key_prefix is None:
+            self._fragment_key_prefix = self.get_fragment_key_prefix()
+        node = getattr(instance, 'node', instance)
+        return '{}:{}'.format(self._fragment_key_prefix, node.fragment_digest)
+
+    def get_fragment_key_prefix(self, generation=None):
+        template_set = app_settings.CMSPLUGIN_CASCADE.get('bootstrap4', {}).get('template_basedir', '')
+        namespace = ':'.join(str(part) for part in (
+            getattr(settings, 'SITE_ID', ''), self.language, template_set, self.datafile or ''))
+        if generation is None:
+            generation = get_stride_generation(self.datafile)
+        return 'cascade_fragment:{}:{}'.format(hashlib.md5(namespace.encode('utf-8')).hexdigest(), generation)
+
+    def get_fragment(self, key):
+        try:
+            return self._fragments[key]
+        except KeyError:
+            # not prefetched, for instance if ``render_plugin`` was invoked outside of ``render_cascade``
+            fragment = self._fragments[key] = get_fragment_store().get_many([key]).get(key)
+            return fragment
+
+    def claim_fragment(self, key):
+        """
+        Return the fragment for the given key, or None if it must be rendered by this process.
+        While one process holds the lock to render a fragment, the others serve its stale content
+        or, if there is none, wait for that process to store it.
+        """
+        fragment = self.get_fragment(key)
+        if fragment is not None and not isinstance(fragment, StaleFragment):
+            return fragment
+        store = get_fragment_store()
+        token = store.acquire(key)
+        if token:
+            self._locks[key] = token
+            return None
+        if fragment is None:
+            fragment = self._fragments[key] = store.wait(key)
+        return fragment
+
+    def prefetch_fragments(self, nodes):
+        """
+        Fetch the rendered fragments of all nodes in the given tree using one cache round-trip.
+        """
+        if not app_settings.CMSPLUGIN_CASCADE['cache_strides']:
+            return
+        keys = self._get_missing_fragment_keys(nodes)
+        if keys:
+            fragments = get_fragment_store().get_many(keys)
+            self._fragments.update((key, fragments.get(key)) for key in keys)
+
+    async def aprefetch_fragments(self, nodes):
+        """
+        Asynchronous variant of ``prefetch_fragments()``.
+        """
+        if not app_settings.CMSPLUGIN_CASCADE['cache_strides']:
+            return
+        if self._fragment_key_prefix is None:
+            self._fragment_key_prefix = self.get_fragment_key_prefix(await aget_stride_generation(self.datafile))
+        keys = self._get_missing_fragment_keys(nodes)
+        if keys:
+            fragments = await get_fragment_store().aget_many(keys)
+            self._fragments.update((key, fragments.get(key)) for key in keys)
+
+    def _get_missing_fragment_keys(self, nodes):
+        if self._fragment_key_prefix is None:
+            self._fragment_key_prefix = self.get_fragment_key_prefix()
+        keys = ('{}:{}'.format(self._fragment_key_prefix, digest)
+                for node in nodes for digest in node.get_fragment_digests())
+        return [key for key in keys if key not in self._fragments]
+
+    def _get_prefetched_fragment(self, node):
+        if app_settings.CMSPLUGIN_CASCADE['cache_strides'] and getattr(node.plugin, 'cache', True):
+            fragment = self._fragments.get(self.get_fragment_key(node))
+            if not isinstance(fragment, StaleFragment):
+                return fragment
+
+    def flush_fragments(self):
+        """
+        Write all rendered fragments to the cache using one cache round-trip and release the locks
+        held for rendering them.
+        """
+        store = get_fragment_store()
+        try:
+            if self._pending_fragments:
+                store.set_many(self._pending_fragments, self._render_durations)
+        finally:
+            self._pending_fragments, self._render_durations = {}, {}
+            locks, self._locks = self._locks, {}
+            store.release(locks)
+
+    @staticmethod
+    def _extend_sekizai_blocks(sekizai_blocks, other_blocks):
+        if sekizai_blocks is None:
+            return
+        for name, data in other_blocks.items():
+            sekizai_blocks[name].extend(data)
+
     def user_is_on_edit_mode(self):
         return False
 
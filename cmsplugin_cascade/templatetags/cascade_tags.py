@@ -1,5 +1,4 @@
 import io
-import json
 import os
 
 from cms.toolbar.utils import get_toolbar_from_request
@@ -7,9 +6,7 @@ from cms.plugin_rendering import StructureRenderer
 
 from django import template
 from django.conf import settings
-from django.core.cache import caches
 from django.template.exceptions import TemplateDoesNotExist
-from django.contrib.staticfiles import finders
 from django.utils.safestring import mark_safe
 from classytags.arguments import Argument
 from classytags.core import Options, Tag
@@ -33,32 +30,14 @@ class StrideRenderer(Tag):
     )
 
     def render_tag(self, context, datafile):
-        from sekizai.helpers import get_varname as get_sekizai_context_key
-        from cmsplugin_cascade.strides import StrideContentRenderer
-
-        cache = caches['default']
-        tree_data_key = 'cascade-strides:' + datafile
-        tree_data = cache.get(tree_data_key) if cache else None
-        if tree_data is None:
-            jsonfile = finders.find(datafile)
-            if not jsonfile:
-                raise IOError("Unable to find file: {}".format(datafile))
-
-            with io.open(jsonfile) as fp:
-                tree_data = json.load(fp)
+        from cmsplugin_cascade.strides import StrideContentRenderer, stride_trees
 
+        tree_data = stride_trees.get_tree(datafile)
         content_renderer = StrideContentRenderer(context['request'])
+        # content added to Sekizai blocks by templatetags `addtoblock` or `add_data`, is cached together
+        # with each fragment and re-added to the context, whenever that fragment is taken from the cache
         with context.push(cms_content_renderer=content_renderer):
             content = content_renderer.render_cascade(context, tree_data)
-
-        # some templates use Sekizai's templatetag `addtoblock` or `add_data`, which have to be re-added to the context
-        cache = caches['default']
-        if cache:
-            sekizai_context_key = get_sekizai_context_key()
-            SEKIZAI_CONTENT_HOLDER = cache.get_or_set(sekizai_context_key, context.get(sekizai_context_key))
-            if SEKIZAI_CONTENT_HOLDER:
-                for name in SEKIZAI_CONTENT_HOLDER:
-                    context[sekizai_context_key][name] = SEKIZAI_CONTENT_HOLDER[name]
         return content
 
 register.tag('render_cascade', StrideRenderer)
@@ -1,3 +1,6 @@
+import hashlib
+import json
+
 from django.core.exceptions import ValidationError
 from django.forms.fields import MultipleChoiceField
 from django.forms.widgets import CheckboxSelectMultiple, MediaDefiningClass
@@ -14,6 +17,20 @@ def remove_duplicates(lst):
     return [l for l in lst if l not in dset and not dset.add(l)]
 
 
+def get_subtree_digest(plugin_type, data, render_template=None, children_digests=()):
+    """
+    Return a Merkle hash for a subtree of plugins, built from the plugin type, its serialized data,
+    as returned by ``get_data_representation()`` but without its primary key, its render template
+    and the hashes of its children. Hence an unchanged subtree keeps its hash, even if it has been
+    copied, while any modification changes the hashes of all its ancestors.
+    """
+    content = json.dumps(
+        [plugin_type, {k: v for k, v in data.items() if k != 'pk'}, render_template, list(children_digests)],
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
 def rectify_partial_form_field(base_field, partial_form_fields):
     """
     In base_field reset the attributes label and help_text, since they are overriden by the
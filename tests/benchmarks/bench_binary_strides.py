@@ -0,0 +1,85 @@
+"""
+Compare load time and memory consumption of stride trees in JSON and in binary format,
+using a corpus of about 50k nodes. Each format is loaded in a fresh process.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=tests.settings python -m tests.benchmarks.bench_binary_strides
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+
+from tests.benchmarks.bench_stride_nodes import build_plugins
+
+
+def read_memory():
+    """
+    Return the resident and the private memory of this process in bytes.
+    """
+    memory = {}
+    with open('/proc/self/smaps_rollup') as fp:
+        for line in fp:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Private_Clean:', 'Private_Dirty:'):
+                memory[parts[0]] = int(parts[1]) * 1024
+    return memory['Rss:'], memory['Private_Clean:'] + memory['Private_Dirty:']
+
+
+def measure(static_dir, datafile):
+    django.setup()
+    from django.test import override_settings
+    from cmsplugin_cascade.strides import stride_trees
+
+    with override_settings(STATICFILES_DIRS=[static_dir]):
+        rss, private = read_memory()
+        start = time.perf_counter()
+        tree_data = stride_trees.get_tree(datafile)
+        elapsed = time.perf_counter() - start
+        after_rss, after_private = read_memory()
+
+        # prefetching fragments touches the digests of every node
+        sum(len(digest) for node in tree_data['nodes'] for digest in node.get_fragment_digests())
+        walked_private = read_memory()[1]
+    print(json.dumps({'time': elapsed, 'rss': after_rss - rss, 'private': after_private - private,
+                      'walked': walked_private - private}))
+
+
+def main():
+    django.setup()
+    from cmsplugin_cascade.binary_strides import compile_stride
+
+    plugins, num_nodes = build_plugins(num_containers=500, num_rows=4, num_columns=12)
+    static_dir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(static_dir, 'corpus.json')
+        with open(source, 'w') as fp:
+            json.dump({'plugins': plugins}, fp)
+        compile_stride(source, os.path.join(static_dir, 'corpus.stride'))
+        print("Corpus of {} nodes".format(num_nodes))
+        for datafile in ('corpus.json', 'corpus.stride'):
+            output = subprocess.check_output([sys.executable, '-m', __spec__.name, static_dir, datafile])
+            result = json.loads(output)
+            print("{:14} file: {:6.1f} MiB, load: {:7.1f} ms, RSS: {:+7.1f} MiB, private: {:+7.1f} MiB, "
+                  "after prefetching: {:+7.1f} MiB".format(
+                      datafile,
+                      os.path.getsize(os.path.join(static_dir, datafile)) / 2**20,
+                      result['time'] * 1000,
+                      result['rss'] / 2**20,
+                      result['private'] / 2**20,
+                      result['walked'] / 2**20,
+                  ))
+    finally:
+        shutil.rmtree(static_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        measure(*sys.argv[1:])
+    else:
+        main()
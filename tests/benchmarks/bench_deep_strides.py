@@ -0,0 +1,68 @@
+"""
+Measure time and memory allocations required to render deeply nested stride trees.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=tests.settings python -m tests.benchmarks.bench_deep_strides
+"""
+import time
+import tracemalloc
+
+import django
+
+from tests.benchmarks.stride_plugins import StridePluginFactory
+
+
+def build_plugins(depth, num_context_vars=50):
+    """
+    Return a serialized tree of alternately nested Bootstrap rows and columns, where each row
+    contains two columns, but only the first one is nested further.
+    """
+    factory = StridePluginFactory()
+
+    def row(level):
+        return factory.row([column(level + 1), column(depth)])
+
+    def column(level):
+        children = [row(level + 1)] if level < depth else [factory.text("<p>Lorem ipsum</p>")]
+        return factory.column(children)
+
+    return [factory.container([row(1)])], factory.num_plugins
+
+
+def main():
+    django.setup()
+    from django.template.context import make_context
+    from django.test import RequestFactory
+    from sekizai.context_processors import sekizai
+    from cmsplugin_cascade import app_settings
+    from cmsplugin_cascade.strides import StrideContentRenderer, StrideNode, StrideTreeCache
+
+    app_settings.CMSPLUGIN_CASCADE['cache_strides'] = False
+    request = RequestFactory().get('/')
+    for depth in (10, 20, 40):
+        plugins, num_nodes = build_plugins(depth)
+        tree_data = dict(plugins=StrideTreeCache._freeze(plugins))
+        tree_data.update(nodes=StrideNode.build(tree_data['plugins']))
+        context_vars = {'var{}'.format(k): k for k in range(50)}
+
+        def render():
+            context = make_context(dict(sekizai(request), request=request, **context_vars), request)
+            return StrideContentRenderer(request).render_cascade(context, tree_data)
+
+        render()  # warm up template caches
+        repeat = 20
+        start = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        elapsed = (time.perf_counter() - start) / repeat
+
+        tracemalloc.start()
+        render()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("depth {:3}, {:4} nodes: {:7.2f} ms per rendering, peak {:8.1f} KiB".format(
+            depth, num_nodes, elapsed * 1000, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Measure the time required to iterate over 100k Cascade elements fetched from the database, once
+without and once with accessing their glossaries. Uses an in-memory SQLite database.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=tests.settings python -m tests.benchmarks.bench_glossary_decoding
+"""
+import json
+import time
+
+import django
+
+
+def populate(num_rows):
+    from django.db import connection
+    from django.utils.timezone import now
+
+    glossary = json.dumps({
+        'breakpoints': ['xs', 'sm', 'md', 'lg', 'xl'],
+        'xs-column-width': 'col',
+        'sm-column-width': 'col-sm-6',
+        'md-column-offset': 'offset-md-1',
+        'media_queries': {bp: {'width': 540 + 10 * k, 'media': '(min-width: 576px)'}
+                          for k, bp in enumerate(['xs', 'sm', 'md', 'lg', 'xl'])},
+    })
+    created = now()
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO cms_cmsplugin (id, path, depth, numchild, position, language, plugin_type, '
+            'creation_date, changed_date) VALUES (%s, %s, 1, 0, %s, %s, %s, %s, %s)',
+            [(pk, '{:08d}'.format(pk), pk % 100, 'en', 'BootstrapColumnPlugin', created, created)
+             for pk in range(1, num_rows + 1)],
+        )
+        cursor.executemany(
+            'INSERT INTO cmsplugin_cascade_element (cmsplugin_ptr_id, glossary) VALUES (%s, %s)',
+            [(pk, glossary) for pk in range(1, num_rows + 1)],
+        )
+
+
+def measure(label, func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    print("{:34} {:8.1f} ms".format(label, best * 1000))
+
+
+def main():
+    django.setup()
+    from django.db import connection
+    from cmsplugin_cascade import app_settings, models_base
+    from cmsplugin_cascade.models import CascadeElement
+
+    connection.creation.create_test_db(verbosity=0)
+    num_rows = 100000
+    populate(num_rows)
+    print("{} rows".format(num_rows))
+
+    def iterate_plugin_types():
+        for element in CascadeElement.objects.all():
+            element.plugin_type, element.position
+
+    def iterate_glossaries():
+        for element in CascadeElement.objects.all():
+            element.glossary.get('xs-column-width')
+
+    decoders = [None]
+    if 'glossary_decoder' in app_settings.CMSPLUGIN_CASCADE:
+        decoders = ['json.loads', 'orjson.loads']
+    for decoder in decoders:
+        suffix = " ({})".format(decoder) if decoder else ""
+        if decoder:
+            app_settings.CMSPLUGIN_CASCADE['glossary_decoder'] = decoder
+            models_base._glossary_decoder = None
+        measure("plugin types only" + suffix, iterate_plugin_types)
+        measure("glossaries" + suffix, iterate_glossaries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure the time required to build Bootstrap rows from the CSS classes of their columns and to
+compute the bounds of those columns. No database is required.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=tests.settings python -m tests.benchmarks.bench_grid_bounds
+"""
+import random
+import time
+
+import django
+
+
+def build_layouts(num_rows):
+    """
+    Return a list of rows, each containing 1 to 6 columns, each specifying its widths for some
+    of the breakpoints.
+    """
+    rnd = random.Random(4711)
+    widths = {
+        'xs': ['col', 'col-12', 'col-6', 'col-auto'],
+        'sm': ['', 'col-sm', 'col-sm-6', 'col-sm-4'],
+        'md': ['', 'col-md', 'col-md-3', 'col-md-auto'],
+        'lg': ['', 'col-lg-2', 'col-lg'],
+        'xl': ['', 'col-xl-3', 'col-xl'],
+    }
+    return [[[c for c in (rnd.choice(choices) for choices in widths.values()) if c]
+             for _ in range(rnd.randint(1, 6))] for _ in range(num_rows)]
+
+
+def main():
+    django.setup()
+    from cmsplugin_cascade.bootstrap4.grid import Bootstrap4Container, Bootstrap4Row, Bootstrap4Column, Breakpoint
+
+    layouts = build_layouts(2000)
+    print("{} rows, {} columns".format(len(layouts), sum(len(columns) for columns in layouts)))
+
+    def build_and_compute():
+        for columns in layouts:
+            row = Bootstrap4Container().add_row(Bootstrap4Row())
+            for classes in columns:
+                row.add_column(Bootstrap4Column(classes))
+            row.compute_column_bounds()
+
+    rows = []
+    for columns in layouts:
+        row = Bootstrap4Container().add_row(Bootstrap4Row())
+        for classes in columns:
+            row.add_column(Bootstrap4Column(classes))
+        rows.append(row)
+
+    def compute_only():
+        for row in rows:
+            for column in row:
+                for bp in Breakpoint:
+                    column.breaks[bp].bound = None
+            row.compute_column_bounds()
+
+    for label, func in [("build columns and compute", build_and_compute), ("compute bounds only", compute_only)]:
+        best = float('inf')
+        for _ in range(5):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        print("{:28} {:8.1f} ms, {:6.1f} µs per row".format(label, best * 1000, best / len(layouts) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure attribute access on a tree of sharable ``FramedIconPlugin`` elements, all referring to
+the same shared glossary. The elements are built in memory, hence no database is required.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=tests.settings python -m tests.benchmarks.bench_sharable_glossary
+"""
+import time
+
+import django
+
+
+def build_elements(model, shared_glossary, num_parents=100, num_children=100):
+    """
+    Return a list of sharable elements, where each of the ``num_parents`` root elements has
+    ``num_children`` children.
+    """
+    elements, pk = [], 0
+    for _ in range(num_parents):
+        pk += 1
+        parent = model(pk=pk, plugin_type='FramedIconPlugin', glossary={'symbol': 'star', 'text_align': 'center'})
+        parent.shared_glossary = shared_glossary
+        parent.child_plugin_instances = []
+        elements.append(parent)
+        for _ in range(num_children):
+            pk += 1
+            child = model(pk=pk, parent_id=parent.pk, plugin_type='FramedIconPlugin', glossary={'symbol': 'heart'})
+            child.shared_glossary = shared_glossary
+            parent.child_plugin_instances.append(child)
+            elements.append(child)
+    return elements
+
+
+def measure(label, func, elements, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for element in elements:
+            func(element)
+    elapsed = (time.perf_counter() - start) / repeat
+    print("{:28} {:8.2f} ms per pass, {:6.0f} ns per element".format(
+        label, elapsed * 1000, elapsed / len(elements) * 1e9))
+
+
+def main():
+    django.setup()
+    from cms.plugin_pool import plugin_pool
+    from cmsplugin_cascade.models import SharedGlossary
+
+    plugin_class = plugin_pool.get_plugin('FramedIconPlugin')
+    shared_glossary = SharedGlossary(pk=1, plugin_type='FramedIconPlugin', identifier='shared', glossary={
+        'font_size': '2em',
+        'color': ['#ff0000', False],
+        'background_color': ['#ffffff', True],
+        'border': ['1px', 'solid', '#000000'],
+        'border_radius': '50%',
+    })
+    elements = build_elements(plugin_class.model, shared_glossary)
+    print("{} sharable elements".format(len(elements)))
+
+    def plain_attributes(element):
+        return element.pk, element.parent_id, element.plugin_type, element.position, element.language
+
+    def glossary_lookups(element):
+        glossary = element.glossary
+        return glossary.get('symbol'), glossary.get('font_size'), glossary.get('border_radius')
+
+    def repeated_glossary(element):
+        for _ in range(10):
+            element.glossary.get('color')
+
+    def plugin_methods(element):
+        plugin_class.get_css_classes(element)
+        plugin_class.get_inline_styles(element)
+
+    measure("plain attributes", plain_attributes, elements)
+    measure("glossary lookups", glossary_lookups, elements)
+    measure("10x glossary access", repeated_glossary, elements)
+    measure("css classes, inline styles", plugin_methods, elements)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Measure the memory allocations required to render a stride tree.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=tests.settings python -m tests.benchmarks.bench_stride_nodes
+"""
+import tracemalloc
+
+import django
+
+from tests.benchmarks.stride_plugins import StridePluginFactory
+
+
+def build_plugins(num_containers=10, num_rows=3, num_columns=4):
+    """
+    Return a serialized tree of Bootstrap containers, rows and columns, each column containing a text plugin.
+    """
+    factory = StridePluginFactory()
+
+    def column():
+        return factory.column([factory.text("<p>Lorem ipsum dolor</p>")])
+
+    def row():
+        return factory.row([column() for _ in range(num_columns)])
+
+    def container():
+        return factory.container([row() for _ in range(num_rows)])
+
+    return [container() for _ in range(num_containers)], factory.num_plugins
+
+
+def walk(element, elements):
+    elements.append(element)
+    if hasattr(element, 'child_plugin_instances'):
+        for child in element.child_plugin_instances():
+            walk(child, elements)
+
+
+def main():
+    django.setup()
+    from django.template.context import make_context
+    from django.test import RequestFactory
+    from sekizai.context_processors import sekizai
+    from cmsplugin_cascade import app_settings
+    from cmsplugin_cascade.strides import StrideContentRenderer, StrideNode, StrideTreeCache
+
+    app_settings.CMSPLUGIN_CASCADE['cache_strides'] = False
+    plugins, num_nodes = build_plugins()
+    tree_data = dict(plugins=StrideTreeCache._freeze(plugins))
+    tree_data.update(nodes=StrideNode.build(tree_data['plugins']))
+    request = RequestFactory().get('/')
+
+    # instantiate the elements of all nodes, as done for each request
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    elements = []
+    for node in tree_data['nodes']:
+        walk(node.create_element(), elements)
+    after = tracemalloc.take_snapshot()
+    stats = after.compare_to(before, 'lineno')
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    print("Instantiating {} elements: {:.1f} blocks and {:.0f} bytes per node".format(
+        len(elements), blocks / num_nodes, size / num_nodes))
+    del elements
+
+    # render the whole tree
+    renderer = StrideContentRenderer(request)
+    context = make_context(dict(sekizai(request), request=request), request)
+    context['cms_content_renderer'] = renderer
+    renderer.render_cascade(context, tree_data)  # warm up the template cache
+    tracemalloc.reset_peak()
+    current = tracemalloc.get_traced_memory()[0]
+    renderer.render_cascade(context, tree_data)
+    peak = tracemalloc.get_traced_memory()[1] - current
+    print("Rendering {} nodes: peak of {:.0f} bytes per node".format(num_nodes, peak / num_nodes))
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""
+Build serialized trees of Bootstrap plugins, as stored in stride files, for the benchmarks.
+"""
+
+
+class StridePluginFactory:
+    """
+    Create serialized plugins ``(plugin_type, data, children)`` with consecutive primary keys.
+    """
+    def __init__(self):
+        self.num_plugins = 0
+
+    def next_pk(self):
+        self.num_plugins += 1
+        return self.num_plugins
+
+    def text(self, body):
+        return ('TextPlugin', {'pk': self.next_pk(), 'body': body}, [])
+
+    def column(self, children):
+        return ('BootstrapColumnPlugin', {'pk': self.next_pk(), 'glossary': {'xs-column-width': 'col'}}, children)
+
+    def row(self, columns):
+        return ('BootstrapRowPlugin', {'pk': self.next_pk(), 'glossary': {}}, columns)
+
+    def container(self, rows):
+        glossary = {'breakpoints': ['xs', 'sm', 'md', 'lg', 'xl'], 'fluid': False}
+        return ('BootstrapContainerPlugin', {'pk': self.next_pk(), 'glossary': glossary}, rows)
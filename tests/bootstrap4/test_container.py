@@ -1,3 +1,4 @@
+import io
 import pytest
 from bs4 import BeautifulSoup
 from django.utils.html import strip_spaces_between_tags
@@ -5,6 +6,7 @@ from cms.plugin_rendering import ContentRenderer
 from cms.utils.plugins import build_plugin_tree
 from cmsplugin_cascade.models import CascadeElement
 from cmsplugin_cascade.bootstrap4.container import BootstrapColumnPlugin
+from cmsplugin_cascade.bootstrap4.grid import Bound, Breakpoint
 
 
 @pytest.mark.django_db
@@ -81,3 +83,239 @@ def test_edit_bootstrap_row(rf, bootstrap_row):
     html = strip_spaces_between_tags(html).strip()
     assert html == '<div class="container"><div class="row"><div class="col col-sm-3 offset-sm-1">' \
                    '</div><div class="col"></div><div class="col col-sm-4 hidden-sm"></div></div></div>'
+
+
+@pytest.mark.django_db
+def test_load_placeholder_tree(django_assert_max_num_queries, bootstrap_column):
+    from cmsplugin_cascade.models_base import load_placeholder_tree
+
+    column_plugin, column_model = bootstrap_column
+    placeholder = column_model.placeholder
+    identifier = str(column_model)
+    with django_assert_max_num_queries(5):
+        container_model, = load_placeholder_tree(placeholder, 'en')
+        row_model, = container_model.child_plugin_instances
+        loaded_column, = row_model.child_plugin_instances
+        assert loaded_column.pk == column_model.pk
+        assert isinstance(loaded_column.plugin_class(), BootstrapColumnPlugin)
+        assert loaded_column.get_parent_instance() is row_model
+        glossary = loaded_column.get_complete_glossary()
+        assert glossary['breakpoints'] == ['xs', 'sm', 'md', 'lg', 'xl']
+        assert glossary['xs-column-width'] == 'col'
+        assert str(loaded_column) == identifier
+
+
+@pytest.mark.django_db
+def test_cascade_ancestry(django_assert_num_queries, bootstrap_column):
+    from cms.api import add_plugin
+    from cmsplugin_cascade.bootstrap4.container import BootstrapRowPlugin
+    from cmsplugin_cascade.models import CascadeAncestry
+
+    column_plugin, column_model = bootstrap_column
+    row_model = column_model.parent
+    container_model = row_model.parent
+    ancestry = CascadeAncestry.objects.get(plugin_id=column_model.pk)
+    assert ancestry.container_id == container_model.pk
+    assert ancestry.row_id == row_model.pk
+    assert ancestry.column_id is None
+    assert ancestry.ancestors == [[container_model.pk, 'BootstrapContainerPlugin'], [row_model.pk, 'BootstrapRowPlugin']]
+
+    column_model = CascadeElement.objects.get(pk=column_model.pk)
+    with django_assert_num_queries(2):
+        row = column_model.get_ancestry().get_nearest_element('BootstrapRowPlugin')
+    assert row.pk == row_model.pk
+    assert row.plugin_class is BootstrapRowPlugin
+
+    # moving the column changes its path, hence its ancestry is rebuilt on access
+    other_row = add_plugin(column_model.placeholder, BootstrapRowPlugin, 'en', target=container_model)
+    column_model.update(parent=other_row)
+    column_model.move(other_row, pos='last-child')
+    column_model = CascadeElement.objects.get(pk=column_model.pk)
+    assert column_model.get_ancestry().row_id == other_row.pk
+    assert CascadeAncestry.objects.get(plugin_id=column_model.pk).row_id == other_row.pk
+
+    # rebuilding updates existing ancestries in place, rather than deleting and recreating them
+    CascadeAncestry.rebuild(container_model, with_descendants=True)
+    assert CascadeAncestry.objects.filter(plugin_id=column_model.pk).count() == 1
+    assert column_model.get_ancestry().get_nearest_element(*CascadeAncestry.container_types).pk == container_model.pk
+
+
+@pytest.mark.django_db
+def test_lazy_glossary(bootstrap_column):
+    from cmsplugin_cascade.models_base import RawGlossary
+
+    column_plugin, column_model = bootstrap_column
+    column_model = CascadeElement.objects.get(pk=column_model.pk)
+    assert isinstance(column_model.__dict__['glossary'], RawGlossary)
+    assert column_model.glossary['xs-column-width'] == 'col'
+    assert column_model.__dict__['glossary'] is column_model.glossary
+
+    # fetching the glossary without building model instances decodes it immediately
+    queryset = CascadeElement.objects.filter(pk=column_model.pk)
+    assert queryset.values('glossary')[0]['glossary'] == column_model.glossary
+    assert queryset.values_list('glossary', flat=True)[0] == column_model.glossary
+
+
+@pytest.mark.django_db
+def test_skip_unchanged_save(django_assert_num_queries, bootstrap_column):
+    from django.db.models.signals import post_save
+
+    column_plugin, column_model = bootstrap_column
+    column_model = CascadeElement.objects.get(pk=column_model.pk)
+    saved = []
+
+    def receiver(instance, update_fields, **kwargs):
+        saved.append((update_fields, instance.changed_glossary_keys))
+
+    post_save.connect(receiver, sender=CascadeElement)
+    try:
+        with django_assert_num_queries(0):
+            column_model.save()
+        assert column_model.glossary['xs-column-width'] == 'col'
+        with django_assert_num_queries(0):
+            column_model.save()
+        column_model.glossary['xs-column-width'] = 'col-6'
+        column_model.save()
+        with django_assert_num_queries(0):
+            column_model.save()
+    finally:
+        post_save.disconnect(receiver, sender=CascadeElement)
+    assert saved == [({'glossary', 'changed_date'}, {'xs-column-width'})]
+    assert CascadeElement.objects.get(pk=column_model.pk).glossary['xs-column-width'] == 'col-6'
+
+
+@pytest.mark.django_db
+def test_solve_grid(django_assert_num_queries, bootstrap_column):
+    column_plugin, column_model = bootstrap_column
+    row_model = column_model.parent
+    container_model = column_model.get_ancestry().get_nearest_element('BootstrapContainerPlugin')
+    with django_assert_num_queries(1):
+        instances = container_model.solve_grid()
+    assert instances[column_model.pk].parent is instances[row_model.pk]
+    assert instances[row_model.pk].parent is instances[container_model.pk]
+    assert instances[column_model.pk].get_min_max_bounds() == {'min': 320.0, 'max': 1140.0}
+    column_model = column_plugin.model.objects.get(pk=column_model.pk)
+    assert column_model.get_grid_instance().get_bound(Breakpoint.md) == Bound(720, 720)
+
+
+@pytest.mark.django_db
+def test_sanitize_grid(django_assert_max_num_queries, bootstrap_column):
+    from cms.api import add_plugin
+    from cmsplugin_cascade.bootstrap4.picture import BootstrapPicturePlugin
+
+    column_plugin, column_model = bootstrap_column
+    row_model = column_model.parent
+    placeholder = column_model.placeholder
+    column_model.glossary = {'xs-column-width': 'col-6'}
+    column_model.save()
+    other_column = add_plugin(placeholder, BootstrapColumnPlugin, 'en', target=row_model,
+                              glossary={'xs-column-width': 'col-6'})
+    picture = add_plugin(placeholder, BootstrapPicturePlugin, 'en', target=column_model)
+    other_picture = add_plugin(placeholder, BootstrapPicturePlugin, 'en', target=other_column)
+    assert picture.glossary['media_queries']['xs']['width'] == 286
+    CascadeElement.objects.filter(pk=other_picture.pk).update(glossary={'stale': True})
+
+    container_model = column_model.get_ancestry().get_nearest_element('BootstrapContainerPlugin')
+    previous_bounds = container_model.get_grid_bounds()
+    CascadeElement.objects.filter(pk=column_model.pk).update(glossary={'xs-column-width': 'col-4'})
+    with django_assert_max_num_queries(9):
+        container_model.sanitize_grid(previous_bounds)
+    picture = CascadeElement.objects.get(pk=picture.pk)
+    assert picture.glossary['media_queries']['xs']['width'] == 191
+    # the bounds of the other column did not change, hence its picture was not sanitized
+    assert CascadeElement.objects.get(pk=other_picture.pk).glossary == {'stale': True}
+
+
+@pytest.mark.django_db
+def test_sanitize_pending(bootstrap_column):
+    from cms.api import add_plugin
+    from django.core.management import call_command
+    from cmsplugin_cascade.bootstrap4.picture import BootstrapPicturePlugin
+    from cmsplugin_cascade.models import PendingSanitize
+
+    column_plugin, column_model = bootstrap_column
+    column_model.glossary = {'xs-column-width': 'col-6'}
+    column_model.save()
+    picture = add_plugin(column_model.placeholder, BootstrapPicturePlugin, 'en', target=column_model)
+    assert picture.glossary['media_queries']['xs']['width'] == 286
+
+    container_model = column_model.get_ancestry().get_nearest_element('BootstrapContainerPlugin')
+    previous_bounds = container_model.get_grid_bounds()
+    CascadeElement.objects.filter(pk=column_model.pk).update(glossary={'xs-column-width': 'col-4'})
+    container_model.sanitize_grid(previous_bounds, deferred=True)
+    # a repeated edit is coalesced, keeping the bounds before the first edit
+    container_model.sanitize_grid(container_model.get_grid_bounds(), deferred=True)
+    entry = PendingSanitize.objects.get()
+    assert entry.plugin_id == container_model.pk
+    assert entry.previous_bounds[str(column_model.pk)][0] == [160.0, 286.0]
+    picture = CascadeElement.objects.get(pk=picture.pk)
+    assert picture.glossary['media_queries']['xs']['width'] == 286
+
+    call_command('sanitize_pending', stdout=io.StringIO())
+    assert not PendingSanitize.objects.exists()
+    picture = CascadeElement.objects.get(pk=picture.pk)
+    assert picture.glossary['media_queries']['xs']['width'] == 191
+
+
+@pytest.mark.django_db
+def test_resanitize_cascade(bootstrap_column):
+    from cms.api import add_plugin
+    from django.core.management import call_command
+    from cmsplugin_cascade.bootstrap4.picture import BootstrapPicturePlugin
+
+    column_plugin, column_model = bootstrap_column
+    column_model.glossary = {'xs-column-width': 'col-6'}
+    column_model.save()
+    picture = add_plugin(column_model.placeholder, BootstrapPicturePlugin, 'en', target=column_model)
+    glossary = dict(picture.glossary, media_queries={'xs': {'width': 100, 'media': '(max-width: 575.98px)'}})
+    CascadeElement.objects.filter(pk=picture.pk).update(glossary=glossary)
+
+    stdout = io.StringIO()
+    call_command('resanitize_cascade', dry_run=True, processes=1, stdout=stdout)
+    assert "Would change 1 elements of type BootstrapPicturePlugin" in stdout.getvalue()
+    assert "Would change glossary key 'media_queries' of 1 elements" in stdout.getvalue()
+    assert CascadeElement.objects.get(pk=picture.pk).glossary['media_queries']['xs']['width'] == 100
+
+    stdout = io.StringIO()
+    call_command('resanitize_cascade', processes=1, stdout=stdout)
+    assert "Changed 1 elements of type BootstrapPicturePlugin" in stdout.getvalue()
+    assert CascadeElement.objects.get(pk=picture.pk).glossary['media_queries']['xs']['width'] == 286
+
+
+@pytest.mark.django_db
+def test_render_parent_instances(rf, django_assert_num_queries, bootstrap_column):
+    from cms.api import add_plugin
+    from cms.utils.plugins import assign_plugins
+    from cmsplugin_cascade.bootstrap4.picture import BootstrapPicturePlugin
+
+    column_plugin, column_model = bootstrap_column
+    add_plugin(column_model.placeholder, BootstrapPicturePlugin, 'en', target=column_model)
+    placeholder = type(column_model.placeholder).objects.get(pk=column_model.placeholder_id)
+
+    # while rendering, parents are taken from the plugins django-CMS assigned to the placeholder
+    assign_plugins(rf.get('/'), [placeholder], None, 'en')
+    picture = next(p for p in placeholder._all_plugins_cache if p.plugin_type == 'BootstrapPicturePlugin')
+    with django_assert_num_queries(0):
+        column = picture.get_parent_instance()
+        row = column.get_parent_instance()
+        container = row.get_parent_instance()
+        assert container.get_parent_instance() is None
+    assert column.pk == column_model.pk
+    assert container.plugin_type == 'BootstrapContainerPlugin'
+
+
+@pytest.mark.django_db
+def test_copy_plugins(bootstrap_column):
+    from cms.api import add_plugin
+    from cms.models import Placeholder
+    from cms.utils.copy_plugins import copy_plugins_to
+
+    column_plugin, column_model = bootstrap_column
+    container_model = column_model.parent.parent
+    target = Placeholder.objects.create(slot='Copy')
+    copy_plugins_to(list(container_model.get_tree(container_model)), target, 'en')
+    copies = {plugin.plugin_type: plugin for plugin in target.get_plugins()}
+    column_copy = CascadeElement.objects.get(pk=copies['BootstrapColumnPlugin'].pk)
+    assert column_copy.pk != column_model.pk
+    assert column_copy.glossary['xs-column-width'] == 'col'
+    assert CascadeElement.objects.get(pk=column_model.pk).placeholder_id == column_model.placeholder_id
@@ -1,6 +1,10 @@
+import random
+
 import pytest
 from cmsplugin_cascade.bootstrap4.grid import (Bootstrap4Container, Bootstrap4Row, Bootstrap4Column, BootstrapException,
-                                               Breakpoint, Bound, fluid_bounds)
+                                               Breakpoint, Bound, fluid_bounds, default_bounds, solve_grid,
+                                               compute_bounds, FLEX_COLUMN, AUTO_COLUMN)
+from array import array
 
 def test_breakpoint_iter():
     for k, bp in enumerate(Breakpoint):
@@ -252,6 +256,63 @@ def test_nested_row():
     assert nested_row[1].get_bound(Breakpoint.xl) == Bound(332.5, 332.5)
 
 
+def test_solve_grid():
+    """
+    Same layout as in ``test_nested_row``, but solved in one pass.
+    """
+    nested_rows = [('nested_row', [('nested_col0', ['col-5'], []), ('nested_col1', ['col-7'], [])])]
+    rows = [('row', [('col0', ['col'], nested_rows), ('col1', ['col'], [])])]
+    container, instances = solve_grid(default_bounds, rows)
+    assert container[0] is instances['row']
+    assert instances['col1'].get_bound(Breakpoint.md) == Bound(360.0, 360.0)
+    assert instances['nested_row'].parent is instances['col0']
+    assert instances['nested_col0'].get_bound(Breakpoint.xs) == Bound(66.7, 119.2)
+    assert instances['nested_col1'].get_bound(Breakpoint.xl) == Bound(332.5, 332.5)
+
+    # identical rows are solved only once
+    container, instances = solve_grid(default_bounds, rows)
+    assert instances['nested_col1'].get_bound(Breakpoint.xl) == Bound(332.5, 332.5)
+
+    with pytest.raises(BootstrapException):
+        solve_grid(default_bounds, [('row', [('col0', ['col', 'col-3'], [])])])
+
+
+def test_compute_bounds():
+    width_codes = array('b', [6, 4, 4, 4, 4, FLEX_COLUMN, FLEX_COLUMN, AUTO_COLUMN, 0, 0])
+    minima, maxima = compute_bounds(width_codes, {Breakpoint.xs: Bound(320, 572), Breakpoint.md: Bound(720, 720)})
+    assert (minima[0], maxima[0]) == (160.0, 286.0)
+    assert (minima[5], maxima[5]) == (160.0, 286.0)
+    # breakpoint sm is missing, hence it uses the bounds of xs
+    assert (minima[1], maxima[1]) == pytest.approx((320 / 3, 572 / 3))
+    assert (minima[7], maxima[7]) == pytest.approx((30.0, 450.0))
+    assert minima[8] != minima[8]  # unspecified widths are NaN
+
+
+def test_compute_bounds_numpy():
+    from cmsplugin_cascade.bootstrap4 import grid
+
+    pytest.importorskip('numpy')
+    randomizer = random.Random(4)
+    choices = [0, FLEX_COLUMN, AUTO_COLUMN, 1, 3, 4, 6, 12]
+    for bounds in [{Breakpoint.xs: Bound(320, 572), Breakpoint.lg: Bound(960, 1140)}, {Breakpoint.md: Bound(720, 720)}]:
+        for _ in range(20):
+            num_columns = randomizer.randint(grid.NUMPY_MIN_COLUMNS, 2 * grid.NUMPY_MIN_COLUMNS)
+            width_codes = array('b', [randomizer.choice(choices) for _ in range(5 * num_columns)])
+            row_min, row_max = grid._get_row_limits(bounds)
+            expected = grid._compute_bounds_python(width_codes, row_min, row_max)
+            computed = compute_bounds(width_codes, bounds)
+            for values, expected_values in zip(computed, expected):
+                # NaN marks unspecified widths, which must be the same in both implementations
+                assert [value != value for value in values] == [value != value for value in expected_values]
+                assert [value for value in values if value == value] == \
+                    pytest.approx([value for value in expected_values if value == value])
+
+
+def test_column_units_out_of_range():
+    with pytest.raises(BootstrapException):
+        Bootstrap4Column('col-md-13')
+
+
 def test_repr():
     container = Bootstrap4Container()
     row = container.add_row(Bootstrap4Row())
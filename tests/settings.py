@@ -1,3 +1,5 @@
+import tempfile
+
 from django.utils.text import format_lazy
 from django.urls import reverse_lazy
 
@@ -37,6 +39,9 @@ STATIC_URL = '/static/'
 
 MEDIA_URL = '/media/'
 
+# keep files uploaded by the tests out of the working tree
+MEDIA_ROOT = tempfile.mkdtemp(prefix='cmsplugin_cascade_media_')
+
 TEMPLATES = [{
     'BACKEND': 'django.template.backends.django.DjangoTemplates',
     'APP_DIRS': True,
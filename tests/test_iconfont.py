@@ -111,3 +111,59 @@ def test_simple_icon(rf, simple_icon):
     content_renderer = ContentRenderer(request)
     html = content_renderer.render_plugin(simple_icon_model, context).strip()
     assert html == '<i class="icon-icon-skiing"></i>'
+
+
+@pytest.mark.django_db
+def test_shared_glossary(cms_placeholder, django_assert_num_queries):
+    from cms.plugin_pool import plugin_pool
+    from cmsplugin_cascade.models import SharedGlossary
+
+    plugin_class = plugin_pool.get_plugin('FramedIconPlugin')
+    shared_glossary = SharedGlossary.objects.create(
+        plugin_type='FramedIconPlugin', identifier='large', glossary={'font_size': '3em'})
+    element = add_plugin(cms_placeholder, plugin_class, 'en', glossary={'symbol': 'star'})
+    element.shared_glossary = shared_glossary
+    element.save()
+
+    with django_assert_num_queries(1):
+        element = plugin_class.get_render_queryset().get(pk=element.pk)
+        assert element.glossary['font_size'] == '3em'
+        own_glossary = element.__dict__['glossary']
+        assert element.glossary is element.glossary
+        assert plugin_class.get_inline_styles(element)['font-size'] == '3em'
+    assert 'font_size' not in own_glossary
+
+    # replacing the shared glossary affects the merged glossary
+    element.shared_glossary = SharedGlossary.objects.create(
+        plugin_type='FramedIconPlugin', identifier='small', glossary={'font_size': '1em'})
+    assert element.glossary['font_size'] == '1em'
+    element.shared_glossary = None
+    assert element.glossary is own_glossary
+
+    # saving a shared element keeps its own values, which reappear after unsharing
+    element = add_plugin(cms_placeholder, plugin_class, 'en', glossary={'symbol': 'star', 'font_size': '2em'})
+    element.shared_glossary = shared_glossary
+    element.save()
+    element = plugin_class.get_render_queryset().get(pk=element.pk)
+    assert element.glossary['font_size'] == '3em'
+    element.glossary['symbol'] = 'heart'
+    element.save()
+    element = plugin_class.get_render_queryset().get(pk=element.pk)
+    assert element.glossary == {'symbol': 'heart', 'font_size': '3em'}
+    element.shared_glossary = None
+    element.save()
+    element = plugin_class.get_render_queryset().get(pk=element.pk)
+    assert element.glossary == {'symbol': 'heart', 'font_size': '2em'}
+
+    # swapping shared glossaries keeps modifications, but not the values shared before
+    element.shared_glossary = SharedGlossary.objects.create(
+        plugin_type='FramedIconPlugin', identifier='colored', glossary={'font_size': '4em', 'color': 'red'})
+    assert element.glossary['color'] == 'red'
+    element.glossary['symbol'] = 'star'
+    element.shared_glossary = shared_glossary
+    assert element.glossary == {'symbol': 'star', 'font_size': '3em'}
+    element.save()
+    element.shared_glossary = None
+    element.save()
+    element = plugin_class.get_render_queryset().get(pk=element.pk)
+    assert element.glossary == {'symbol': 'star', 'font_size': '2em'}
@@ -1,19 +1,30 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import io
 import json
 import django
 import os
+import shutil
+import tempfile
+import time
+from unittest import mock
 
+from asgiref.sync import async_to_sync
 from bs4 import BeautifulSoup
 
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.urls import reverse
 from django.template import RequestContext, Template
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
 
+from cmsplugin_cascade import app_settings, strides
+from cmsplugin_cascade.fragments import StaleFragment, SharedFragmentStore, get_fragment_store
 from cmsplugin_cascade.models import IconFont
+from cmsplugin_cascade.strides import StrideContentRenderer, StrideNode, invalidate_stride, stride_trees
 from filer.admin.clipboardadmin import ajax_upload
 
 from .test_base import CascadeTestCase
@@ -137,3 +148,360 @@ class StridePluginTest(CascadeTestCase):
         soup = BeautifulSoup(html, features='lxml')
         button = soup.find(class_='btn')
         self.assertSetEqual(set(button.attrs['class']), {'btn', 'btn-secondary'})
+
+    def test_stride_tree_cache(self):
+        static_dir = tempfile.mkdtemp()
+        try:
+            datafile = os.path.join(static_dir, 'text-plugin.json')
+            shutil.copy(os.path.join(os.path.dirname(__file__), 'static/strides/text-plugin.json'), datafile)
+            with override_settings(STATICFILES_DIRS=[static_dir]):
+                stride_trees.clear()
+                tree_data = stride_trees.get_tree('text-plugin.json')
+                self.assertIsInstance(tree_data['plugins'], tuple)
+                self.assertIs(stride_trees.get_tree('text-plugin.json'), tree_data)
+
+                # modifying the stride file invalidates the cached tree
+                with open(datafile) as fp:
+                    content = json.load(fp)
+                content['plugins'][0][1]['body'] = "<p>Changed</p>"
+                with open(datafile, 'w') as fp:
+                    json.dump(content, fp)
+                stat = os.stat(datafile)
+                os.utime(datafile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+                changed_tree = stride_trees.get_tree('text-plugin.json')
+                self.assertIsNot(changed_tree, tree_data)
+                self.assertEqual(changed_tree['plugins'][0][1]['body'], "<p>Changed</p>")
+        finally:
+            stride_trees.clear()
+            shutil.rmtree(static_dir)
+
+    def test_binary_stride(self):
+        static_dir = tempfile.mkdtemp()
+        try:
+            for name in ['text-plugin', 'bootstrap-container']:
+                shutil.copy(os.path.join(os.path.dirname(__file__), 'static/strides/{}.json'.format(name)), static_dir)
+            with override_settings(STATICFILES_DIRS=[static_dir]):
+                stride_trees.clear()
+                call_command('compile_strides', 'text-plugin.json', 'bootstrap-container.json', stdout=io.StringIO())
+                for name in ['text-plugin', 'bootstrap-container']:
+                    json_tree = stride_trees.get_tree('{}.json'.format(name))
+                    binary_tree = stride_trees.get_tree('{}.stride'.format(name))
+                    self.assertNotIn('plugins', binary_tree)
+                    json_node, binary_node = json_tree['nodes'][0], binary_tree['nodes'][0]
+                    # children of memory mapped nodes are built on first access, but not for prefetching
+                    self.assertEqual(list(binary_node.get_fragment_digests()), list(json_node.get_fragment_digests()))
+                    self.assertIsNone(binary_node._children)
+                    self.assertEqual(binary_node.pk, json_node.pk)
+                    self.assertEqual(binary_node.data, json_node.data)
+                    self.assertEqual(binary_node.fragment_digest, json_node.fragment_digest)
+                    template = '{{% load cascade_tags %}}{{% render_cascade "{}" %}}'
+                    self.assertHTMLEqual(
+                        Template(template.format('{}.stride'.format(name))).render(self.context),
+                        Template(template.format('{}.json'.format(name))).render(self.context),
+                    )
+
+                # fragment digests of plugins not caching their fragments are computed on demand
+                with open(os.path.join(static_dir, 'text-plugin.json')) as fp:
+                    text_plugin = json.load(fp)['plugins'][0]
+                with open(os.path.join(static_dir, 'bootstrap-container.json')) as fp:
+                    container = json.load(fp)['plugins'][0]
+                container[2] = [[text_plugin[0], dict(text_plugin[1], pk=pk), []] for pk in (1, 2)]
+                with open(os.path.join(static_dir, 'nested.json'), 'w') as fp:
+                    json.dump({'plugins': [container]}, fp)
+                with mock.patch.object(strides.strides_plugin_map['TextPlugin'], 'cache', False, create=True):
+                    call_command('compile_strides', 'nested.json', stdout=io.StringIO())
+                    json_node = stride_trees.get_tree('nested.json')['nodes'][0]
+                    binary_node = stride_trees.get_tree('nested.stride')['nodes'][0]
+                    self.assertEqual(list(binary_node.get_fragment_digests()), [json_node.fragment_digest])
+                    self.assertEqual(binary_node.children[1].fragment_digest, json_node.children[1].fragment_digest)
+                    self.assertNotEqual(binary_node.children[1].fragment_digest, binary_node.children[0].fragment_digest)
+
+                # the text bodies of memory mapped nodes are tokenized only on their first rendering
+                template = Template('{% load cascade_tags %}{% render_cascade "text-plugin.stride" %}')
+                html = template.render(self.context)
+                with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, cache_strides=False), \
+                    mock.patch.object(strides.TextStrideElement, 'tokenize_body') as tokenize_body:
+                    self.assertHTMLEqual(template.render(self.context), html)
+                    tokenize_body.assert_not_called()
+        finally:
+            stride_trees.clear()
+            shutil.rmtree(static_dir)
+
+    def test_fragment_cache_round_trips(self):
+        self.upload_icon_font()
+        icon_font = IconFont.objects.first()
+        icon_font.id = 1  # to match id in fixture "strides/framed-icon.json"
+        icon_font.save()
+
+        cache = caches['default']
+        cache.clear()
+        template = Template('{% load cascade_tags sekizai_tags %}{% render_cascade "strides/framed-icon.json" %}{% render_block "css" %}')
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as cache_get_many, \
+            mock.patch.object(cache, 'set_many', wraps=cache.set_many) as cache_set_many:
+            html = template.render(RequestContext(RequestFactory().get('/'), {}))
+            self.assertEqual(cache_get_many.call_count, 1)
+            self.assertEqual(cache_set_many.call_count, 1)
+            self.assertIn('<link href="/media/icon_fonts/', html)
+
+            # the second rendering is served from cache, including the content of the Sekizai blocks
+            self.assertEqual(template.render(RequestContext(RequestFactory().get('/'), {})), html)
+            self.assertEqual(cache_get_many.call_count, 2)
+            self.assertEqual(cache_set_many.call_count, 1)
+
+    def test_fragment_key_namespace(self):
+        cache = caches['default']
+        cache.clear()
+        tree_data = stride_trees.get_tree('strides/bootstrap-column.json')
+        instance = tree_data['nodes'][0]
+
+        def get_fragment_key(language, datafile='strides/bootstrap-column.json'):
+            renderer = StrideContentRenderer(RequestFactory().get('/', HTTP_ACCEPT_LANGUAGE=language))
+            renderer.language = language
+            renderer.datafile = datafile
+            return renderer.get_fragment_key(instance)
+
+        key = get_fragment_key('en')
+        self.assertEqual(get_fragment_key('en'), key)
+        self.assertNotEqual(get_fragment_key('de'), key)
+        self.assertNotEqual(get_fragment_key('en', 'strides/framed-icon.json'), key)
+        with override_settings(SITE_ID=2):
+            self.assertNotEqual(get_fragment_key('en'), key)
+
+        # invalidating one stride file does not affect the fragments of another one
+        other_key = get_fragment_key('en', 'strides/framed-icon.json')
+        invalidate_stride('strides/bootstrap-column.json')
+        self.assertNotEqual(get_fragment_key('en'), key)
+        self.assertEqual(get_fragment_key('en', 'strides/framed-icon.json'), other_key)
+
+    def test_stream_cascade(self):
+        self.upload_icon_font()
+        icon_font = IconFont.objects.first()
+        icon_font.id = 1  # to match id in fixture "strides/framed-icon.json"
+        icon_font.save()
+
+        request = RequestFactory().get('/')
+        tree_data = stride_trees.get_tree('strides/framed-icon.json')
+        chunks = list(StrideContentRenderer(request).stream_cascade(RequestContext(request, {}), tree_data, ['css']))
+        self.assertEqual(len(chunks), len(tree_data['nodes']) + 1)
+        self.assertIn('<span class="icon-umbrella"', chunks[0])
+        self.assertIn('<link href="/media/icon_fonts/', chunks[-1])
+
+    def test_render_threads(self):
+        caches['default'].clear()
+        plugins = [('TextPlugin', {'pk': pk, 'body': '<p>Paragraph {}</p>'.format(pk)}, []) for pk in range(1, 6)]
+        request = RequestFactory().get('/')
+        html = StrideContentRenderer(request).render_cascade(RequestContext(request, {}), {'plugins': plugins})
+        caches['default'].clear()
+        with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, stride_render_threads=3), \
+            mock.patch.object(StrideContentRenderer, '_render_subtree', autospec=True,
+                              side_effect=StrideContentRenderer._render_subtree) as render_subtree, \
+            mock.patch.object(strides.connections, 'close_all') as close_all:
+            renderer = StrideContentRenderer(request)
+            self.assertEqual(renderer.render_cascade(RequestContext(request, {}), {'plugins': plugins}), html)
+            self.assertEqual(render_subtree.call_count, 5)
+            # each subtree is rendered by a renderer of its own, which closes its connections
+            self.assertNotIn(renderer, [call.args[0] for call in render_subtree.call_args_list])
+            self.assertEqual(close_all.call_count, 5)
+
+            # subtrees found in the cache are not submitted to the thread pool
+            renderer = StrideContentRenderer(request)
+            self.assertEqual(renderer.render_cascade(RequestContext(request, {}), {'plugins': plugins}), html)
+            self.assertEqual(render_subtree.call_count, 5)
+        self.assertIn('<p>Paragraph 5</p>', html)
+
+    def test_arender_cascade(self):
+        caches['default'].clear()
+        plugins = [('TextPlugin', {'pk': pk, 'body': '<p>Paragraph {}</p>'.format(pk)}, []) for pk in range(1, 4)]
+        request = RequestFactory().get('/')
+        html = StrideContentRenderer(request).render_cascade(RequestContext(request, {}), {'plugins': plugins})
+        caches['default'].clear()
+        renderer = StrideContentRenderer(request)
+        self.assertEqual(async_to_sync(renderer.arender_cascade)(RequestContext(request, {}), {'plugins': plugins}), html)
+
+        # a fully cached stride is rendered without rendering any plugin
+        with mock.patch.object(StrideContentRenderer, 'render_plugin') as render_plugin:
+            renderer = StrideContentRenderer(request)
+            self.assertEqual(async_to_sync(renderer.arender_cascade)(RequestContext(request, {}), {'plugins': plugins}), html)
+            render_plugin.assert_not_called()
+
+    def test_two_tier_fragment_store(self):
+        cache = caches['default']
+        cache.clear()
+        template = Template('{% load cascade_tags %}{% render_cascade "strides/text-plugin.json" %}')
+        store_class = 'cmsplugin_cascade.fragments.TwoTierFragmentStore'
+        with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, stride_fragment_store=store_class), \
+            mock.patch.object(cache, 'get_many', wraps=cache.get_many) as cache_get_many:
+            store = get_fragment_store()
+            store.clear()
+            store.reset_stats()
+            html = template.render(self.context)
+            self.assertEqual(cache_get_many.call_count, 1)
+
+            # the second rendering is served from the local tier
+            self.assertEqual(template.render(self.context), html)
+            self.assertEqual(cache_get_many.call_count, 1)
+            self.assertEqual(store.get_stats(), {'local_hits': 1, 'local_misses': 1, 'shared_hits': 0, 'shared_misses': 1})
+
+            # invalidation is broadcast through the generation counter in the shared tier
+            invalidate_stride('strides/text-plugin.json')
+            self.assertEqual(template.render(self.context), html)
+            self.assertEqual(cache_get_many.call_count, 2)
+
+    def get_fragment_key(self, datafile):
+        renderer = StrideContentRenderer(self.context.request)
+        renderer.datafile = datafile
+        return renderer.get_fragment_key(stride_trees.get_tree(datafile)['nodes'][0])
+
+    def test_stale_while_revalidate(self):
+        cache = caches['default']
+        cache.clear()
+        template = Template('{% load cascade_tags %}{% render_cascade "strides/text-plugin.json" %}')
+        settings = dict(stride_fragments_timeout=60, stride_fragments_stale_timeout=60, stride_fragments_lock_timeout=1)
+        with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, **settings):
+            store = get_fragment_store()
+            html = template.render(self.context)
+            with mock.patch('cmsplugin_cascade.fragments.time.time', return_value=time.time() + 90), \
+                mock.patch.object(store, 'set_many', wraps=store.set_many) as store_set_many:
+                # while another process holds the lock, the stale fragment is served
+                fragment_key = self.get_fragment_key('strides/text-plugin.json')
+                token = store.acquire(fragment_key)
+                self.assertTrue(token)
+                self.assertEqual(template.render(self.context), html)
+                store_set_many.assert_not_called()
+
+                # after the lock has been released, the fragment is refreshed by the next request
+                store.release({fragment_key: token})
+                self.assertEqual(template.render(self.context), html)
+                self.assertEqual(store_set_many.call_count, 1)
+                self.assertTrue(store.acquire(fragment_key))
+
+    def test_single_flight(self):
+        caches['default'].clear()
+        template = Template('{% load cascade_tags %}{% render_cascade "strides/text-plugin.json" %}')
+        with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, stride_fragments_lock_timeout=0.2):
+            store = get_fragment_store()
+            fragment_key = self.get_fragment_key('strides/text-plugin.json')
+            store.acquire(fragment_key)
+            with mock.patch.object(store, 'wait', wraps=store.wait) as store_wait:
+                # waits for the lock holder, and renders by itself after the lock expired
+                self.assertIn('<p>Lorem ipsum dolor</p>', template.render(self.context))
+                store_wait.assert_called_once_with(fragment_key)
+
+    def test_release_owned_locks(self):
+        caches['default'].clear()
+        with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, stride_fragments_lock_timeout=60):
+            store = get_fragment_store()
+            token = store.acquire('key')
+            self.assertIsNone(store.acquire('key'))
+
+            # the lock expired and has been acquired by another process, which keeps it
+            caches['default'].delete(store._get_lock_key('key'))
+            other_token = store.acquire('key')
+            store.release({'key': token})
+            self.assertIsNone(store.acquire('key'))
+            store.release({'key': other_token})
+            self.assertTrue(store.acquire('key'))
+
+    def test_early_expiry(self):
+        entry = ('<p>Content</p>', {}, time.time() + 1, 10)
+        with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, stride_fragments_early_expiry_beta=1), \
+            mock.patch('cmsplugin_cascade.fragments.random.random', return_value=0.9):
+            self.assertIsInstance(SharedFragmentStore._unwrap_entries({'key': entry})['key'], StaleFragment)
+        with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, stride_fragments_early_expiry_beta=0):
+            self.assertNotIsInstance(SharedFragmentStore._unwrap_entries({'key': entry})['key'], StaleFragment)
+
+    def test_merkle_digests(self):
+        def build(column_glossary):
+            columns = [
+                ('BootstrapColumnPlugin', {'pk': 3, 'glossary': {'xs-column-width': 'col-12'}}, []),
+                ('BootstrapColumnPlugin', {'pk': 4, 'glossary': column_glossary}, []),
+            ]
+            row = ('BootstrapRowPlugin', {'pk': 2, 'glossary': {}}, columns)
+            container = StrideNode.build([('BootstrapContainerPlugin', {'pk': 1, 'glossary': {}}, [row])])[0]
+            return container, container.children[0].children
+
+        container, (column_a, column_b) = build({'xs-column-width': 'col-12'})
+        self.assertEqual(column_a.digest, column_b.digest)
+        self.assertNotEqual(column_a.fragment_digest, column_b.fragment_digest)
+
+        # editing a column invalidates its own fragment and those of its ancestors, but not of its siblings
+        other_container, (other_column_a, other_column_b) = build({'xs-column-width': 'col-6'})
+        self.assertNotEqual(other_container.digest, container.digest)
+        self.assertNotEqual(other_column_b.fragment_digest, column_b.fragment_digest)
+        self.assertEqual(other_column_a.fragment_digest, column_a.fragment_digest)
+
+    def test_sibling_instances(self):
+        columns = [('BootstrapColumnPlugin', {'pk': pk, 'glossary': {}}, []) for pk in range(2, 5)]
+        row = StrideNode.build([('BootstrapRowPlugin', {'pk': 1, 'glossary': {}}, columns)])[0].create_element()
+        first, middle, last = row.child_plugin_instances()
+        plugin = middle.plugin
+        self.assertEqual(plugin.get_previous_instance(middle).pk, 2)
+        self.assertEqual(plugin.get_next_instance(middle).pk, 4)
+        self.assertIs(plugin.get_next_instance(middle).parent, row)
+        self.assertIsNone(plugin.get_previous_instance(first))
+        self.assertIsNone(plugin.get_next_instance(last))
+
+    def test_text_body_segments(self):
+        body = '<p>Before</p><cms-plugin alt="Text" id="2"></cms-plugin><p>Between</p>' \
+               '<cms-plugin alt="Missing" id="9"></cms-plugin><p>After</p>'
+        child = ('TextPlugin', {'pk': 2, 'body': '<em>Child</em>'}, [])
+        tree_data = {'plugins': [('TextPlugin', {'pk': 1, 'body': body}, [child])]}
+        literals, slots = StrideNode.build(tree_data['plugins'])[0].body_segments
+        self.assertEqual(literals, ('<p>Before</p>', '<p>Between</p><p>After</p>'))
+        self.assertEqual([node.pk for node in slots], [2])
+
+        request = RequestFactory().get('/')
+        html = StrideContentRenderer(request).render_cascade(RequestContext(request, {}), tree_data)
+        self.assertHTMLEqual(html, '<p>Before</p><em>Child</em><p>Between</p><p>After</p>')
+
+    def test_export_bundle(self):
+        from cms.api import add_plugin, publish_page
+        from cmsplugin_cascade.bundle import StrideBundleMiddleware
+
+        add_plugin(self.placeholder, 'TextPlugin', 'en', body="<p>Exported text</p>")
+        publish_page(self.home_page, get_user_model().objects.get(username='admin'), 'en')
+        bundle_root = tempfile.mkdtemp()
+        try:
+            call_command('export_strides', root=bundle_root, bundle_version='v1', stdout=io.StringIO())
+            with open(os.path.join(bundle_root, 'v1', 'manifest.json')) as fp:
+                manifest = json.load(fp)
+            url = self.home_page.get_absolute_url('en')
+            self.assertEqual(manifest['pages'][url]['placeholders'][0][0], 'Main Content')
+
+            middleware = StrideBundleMiddleware(lambda request: None)
+            with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, stride_bundle_root=bundle_root):
+                with self.assertNumQueries(0):
+                    response = middleware(RequestFactory().get(url))
+                    self.assertIsNone(middleware(RequestFactory().get('/missing/')))
+            self.assertContains(response, "<p>Exported text</p>")
+        finally:
+            shutil.rmtree(bundle_root)
+
+    def test_bundle_under_sub_path(self):
+        from cms.api import add_plugin, publish_page
+        from django.urls import set_script_prefix
+        from cmsplugin_cascade.bundle import StrideBundleMiddleware, get_current_bundle
+
+        add_plugin(self.placeholder, 'TextPlugin', 'en', body="<p>Exported text</p>")
+        publish_page(self.home_page, get_user_model().objects.get(username='admin'), 'en')
+        path_info = self.home_page.get_absolute_url('en')
+        bundle_root = tempfile.mkdtemp()
+        try:
+            set_script_prefix('/site/')
+            try:
+                call_command('export_strides', root=bundle_root, bundle_version='v1', stdout=io.StringIO())
+            finally:
+                set_script_prefix('/')
+            middleware = StrideBundleMiddleware(lambda request: None)
+            with mock.patch.dict(app_settings.CMSPLUGIN_CASCADE, stride_bundle_root=bundle_root):
+                response = middleware(RequestFactory().get(path_info, SCRIPT_NAME='/site'))
+                self.assertContains(response, "<p>Exported text</p>")
+
+                # the file CURRENT is read again only after it has been replaced
+                with mock.patch('cmsplugin_cascade.bundle.io.open', wraps=io.open) as io_open:
+                    self.assertIs(get_current_bundle(), get_current_bundle())
+                    io_open.assert_not_called()
+                call_command('export_strides', root=bundle_root, bundle_version='v2', stdout=io.StringIO())
+                self.assertEqual(get_current_bundle().version, 'v2')
+        finally:
+            shutil.rmtree(bundle_root)